@@ -1,36 +1,93 @@
-import requests
+from batching import MicroBatcher
+from metrics import CASCADE_ANSWERS, timed
+from ollama_client import OllamaError
+from scheduler import PRIORITY_HIGH, PRIORITY_NORMAL
+from structured import repair_json
 
-class AGENT:
-    def __init__(
-        self,
-        model,
-        ollama_host
-    ):
-        self.model = model
-        self.ollama_host = ollama_host
-        self.session = requests.Session()
-        self.session.headers.update({"Connection": "keep-alive"})
+CATEGORIES = ("iot", "documentation", "general")
+
+IOT_KEYWORDS = [
+    "ligue", "desligue", "acenda", "apague",
+    "led", "servo", "angulo", "ângulo",
+    "temperatura", "umidade", "humidade",
+    "dht11", "sensor", "ldr", "pomodoro",
+    "comece", "inicie", "pare", "status",
+    "pwm", "gpio", "motor", "acionar"
+]
 
-    def ask_ollama_for_classification(self, user_input):
-        classification_prompt = f"""
-Classify the user's intention using ONE word from the categories below.
+DOCUMENTATION_KEYWORDS = [
+    "franzininho", "datasheet", "pino", "pinos",
+    "wifi lab", "lab01", "tutorial", "especificação",
+    "documentação", "qual pino", "como funciona"
+]
+
+# Static instructions are sent as the system prompt, ahead of the question,
+# so Ollama can reuse their evaluated prefix between calls
+CLASSIFICATION_SYSTEM_PROMPT = """Classify the user's intention using ONE word from the categories below.
 - iot: questions about sensors, actuators, commands, LEDs, temperature, DHT11, GPIO, microcontroller actions, pomodoro timer.
 - documentation: questions about Franzininho, specifications, pins, modules, datasheet, tutorials.
 - general: anything else.
 Rules:
 - Respond with EXACTLY one of these words.
 - Do NOT add any sentence, explanation, or additional text.
-Question: {user_input}
-Answer:
 """
+
+# Several numbered questions classified by one generation
+CLASSIFICATION_BATCH_SYSTEM_PROMPT = """Classify the intention of each numbered question using ONE word from the categories below.
+- iot: questions about sensors, actuators, commands, LEDs, temperature, DHT11, GPIO, microcontroller actions, pomodoro timer.
+- documentation: questions about Franzininho, specifications, pins, modules, datasheet, tutorials.
+- general: anything else.
+Rules:
+- Respond with a JSON object whose "labels" list has one category per question, in the same order.
+"""
+
+QUERY_SYSTEM_PROMPT = (
+    "Respond ONLY with 1 short sentence, with a maximum of 12 words. "
+    "Do not use examples, lists, or explanations. "
+    "Do not write more than ONE sentence."
+)
+
+class AGENT:
+    def __init__(
+        self,
+        model,
+        client,
+        batch_size=16,
+        batch_wait=0.01,
+        batch_workers=1,
+        intent=None,
+        intent_threshold=0.6,
+        cascade=None,
+        query_model=None
+    ):
+        # Classification model, `cascade` lists smaller models tried before it
+        self.model = model
+        self.cascade = list(cascade or [])
+        # Model for general questions
+        self.query_model = query_model or model
+        self.client = client
+        # Optional IntentClassifier, the model is only asked below intent_threshold
+        self.intent = intent
+        self.intent_threshold = intent_threshold
+        self.batch_size = batch_size
+        # Model classifications from concurrent requests are resolved together
+        self.batcher = MicroBatcher(
+            self.classify_pending,
+            max_batch=batch_size,
+            max_wait=batch_wait,
+            workers=batch_workers,
+            name="classification-batcher"
+        )
+
+    def ask_ollama_for_classification(self, user_input, model=None):
+        classification_prompt = f"Question: {user_input}\nAnswer:"
         try:
             print(f"Sending classification request to Ollama")
-            response = self.session.post(
-                f"{self.ollama_host}/api/generate",
-                json={
-                    "model": self.model,
+            response = self.client.generate(
+                {
+                    "model": model or self.model,
+                    "system": CLASSIFICATION_SYSTEM_PROMPT,
                     "prompt": classification_prompt,
-                    "stream": False,
                     "options": {
                         "temperature": 0.0,
                         "num_predict": 5,
@@ -39,65 +96,189 @@ Answer:
                         "stop": ["\n"], 
                         "seed": 42
                     }
-                }
+                },
+                timeout=60,
+                priority=PRIORITY_HIGH,
+                ttl=60
             )
-            if response.status_code != 200:
-                print(f"Error: Received status code {response.status_code}")
-                return "Error"
-
-            response_text = response.json().get("response", "")
+            response_text = response.get("response", "")
             return response_text
                     
-        except Exception as e:
-            print(f"Error connecting to Ollama: {str(e)}")
+        except OllamaError as e:
+            print(str(e))
             return "Error"
 
+    def ask_ollama_for_classification_batch(self, user_inputs, model=None):
+        """One generation for several inputs, returns one category per input (None when missing)"""
+        schema = {
+            "type": "object",
+            "properties": {
+                "labels": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": list(CATEGORIES)},
+                    "minItems": len(user_inputs),
+                    "maxItems": len(user_inputs)
+                }
+            },
+            "required": ["labels"]
+        }
+        prompt = "\n".join(f"{i}. {user_input}" for i, user_input in enumerate(user_inputs, 1))
+        try:
+            print(f"Sending batch of {len(user_inputs)} classifications to Ollama")
+            response = self.client.generate(
+                {
+                    "model": model or self.model,
+                    "system": CLASSIFICATION_BATCH_SYSTEM_PROMPT,
+                    "prompt": prompt,
+                    "format": schema,
+                    "options": {
+                        "temperature": 0.0,
+                        "num_predict": 8 * len(user_inputs) + 16,
+                        "seed": 42
+                    }
+                },
+                timeout=60,
+                priority=PRIORITY_HIGH,
+                ttl=60
+            )
+        except OllamaError as e:
+            print(str(e))
+            return [None] * len(user_inputs)
+        labels = (repair_json(response.get("response", "")) or {}).get("labels", [])
+        if not isinstance(labels, list):
+            labels = []
+        return [
+            labels[i] if i < len(labels) and labels[i] in CATEGORIES else None
+            for i in range(len(user_inputs))
+        ]
+
+    def exact_classification(self, user_input, model):
+        """Single-question classification, None unless the model answered exactly one category"""
+        label = self.ask_ollama_for_classification(user_input, model).strip().strip(".").lower()
+        return label if label in CATEGORIES else None
+
+    def classify_pending(self, user_inputs):
+        """
+        MicroBatcher handler: a lone input keeps the single-question prompt.
+        Cascade models answer first, only the inputs they did not label with
+        exactly one category go on to the next model.
+        """
+        unique = list(dict.fromkeys(user_inputs))
+        labels = [None] * len(unique)
+        for model in self.cascade:
+            pending = [i for i, label in enumerate(labels) if label is None]
+            if not pending:
+                break
+            if len(pending) == 1:
+                answers = [self.exact_classification(unique[pending[0]], model)]
+            else:
+                answers = self.ask_ollama_for_classification_batch([unique[i] for i in pending], model)
+            for i, answer in zip(pending, answers):
+                labels[i] = answer
+                CASCADE_ANSWERS.inc(task="classification", model=model, outcome="accepted" if answer else "escalated")
+
+        pending = [i for i, label in enumerate(labels) if label is None]
+        if len(pending) == 1:
+            response_text = self.ask_ollama_for_classification(unique[pending[0]])
+            labels[pending[0]] = "general" if response_text == "Error" else self.normalize_classification(response_text)
+        elif pending:
+            answers = self.ask_ollama_for_classification_batch([unique[i] for i in pending])
+            for i, answer in zip(pending, answers):
+                labels[i] = answer or "general"
+        by_input = dict(zip(unique, labels))
+        return [by_input[user_input] for user_input in user_inputs]
+
+    def classify_batch(self, user_inputs):
+        """Keyword rules for each input, then one model call per batch_size inputs that no rule matched"""
+        with timed("classification", self.model):
+            results = [self.manual_classification(user_input) for user_input in user_inputs]
+            labels = {}
+            for user_input, c in zip(user_inputs, results):
+                if c == "general" and self.intent is not None and user_input not in labels:
+                    category, confidence = self.intent.classify(user_input)
+                    if category is not None and confidence >= self.intent_threshold:
+                        labels[user_input] = category
+            pending = list(dict.fromkeys(u for u, c in zip(user_inputs, results) if c == "general" and u not in labels))
+            for i in range(0, len(pending), self.batch_size):
+                chunk = pending[i:i + self.batch_size]
+                labels.update(zip(chunk, self.classify_pending(chunk)))
+            return [labels.get(user_input, c) for user_input, c in zip(user_inputs, results)]
+
+    def create_query_prompt(self, query):
+        """Variable part of the prompt, sent after the static QUERY_SYSTEM_PROMPT"""
+        return f"Question: {query}\nAnswer:"
+
     def ask_ollama(self, query):
         try:
             print(f"Sending query to Ollama")
-            forced_query = (
-                "Respond ONLY with 1 short sentence, with a maximum of 12 words. "
-                "Do not use examples, lists, or explanations. "
-                "Do not write more than ONE sentence. "
-                f"Question: {query}\nAnswer:"
-            )
-            response = self.session.post(
-                f"{self.ollama_host}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": forced_query,
-                    "stream": False
-                }
+            forced_query = self.create_query_prompt(query)
+            response = self.client.generate(
+                {
+                    "model": self.query_model,
+                    "system": QUERY_SYSTEM_PROMPT,
+                    "prompt": forced_query
+                },
+                priority=PRIORITY_NORMAL
             )
-            if response.status_code == 200:
-                print(f"Response from Ollama: {response.json().get('response', '')}")
-                return response.json().get("response", "")
-            else:
-                return f"Error: Received status code {response.status_code} from Ollama."
-        except Exception as e:
-            return f"Error connecting to Ollama: {str(e)}"
+            print(f"Response from Ollama: {response.get('response', '')}")
+            return response.get("response", "")
+        except OllamaError as e:
+            return str(e)
+
+    def ask_ollama_stream(self, query):
+        """Yield the answer tokens as Ollama produces them"""
+        print(f"Streaming query to Ollama")
+        try:
+            yield from self.client.generate_stream({
+                "model": self.query_model,
+                "system": QUERY_SYSTEM_PROMPT,
+                "prompt": self.create_query_prompt(query)
+            }, priority=PRIORITY_NORMAL)
+        except OllamaError as e:
+            yield str(e)
+
+    def normalize_classification(self, response_text):
+        """Map the raw model output (e.g. ' IoT.') to one of CATEGORIES"""
+        text = response_text.lower()
+        for category in CATEGORIES:
+            if category in text:
+                return category
+        return "general"
+
+    def classify(self, user_input):
+        """Keyword rules first, then the embedding classifier, the model only when neither is sure"""
+        return self.classify_detailed(user_input)["classification"]
+
+    def classify_detailed(self, user_input):
+        """{"classification", "confidence", "source"}, source is "rules", "embedding" or "model" """
+        with timed("classification", self.model):
+            return self.classify_input(user_input)
+
+    def classify_input(self, user_input):
+        classification = self.manual_classification(user_input)
+        if classification != "general":
+            print(f"Manual classification: {classification}")
+            return {"classification": classification, "confidence": 1.0, "source": "rules"}
+
+        confidence = None
+        if self.intent is not None:
+            category, confidence = self.intent.classify(user_input)
+            print(f"Embedding classification: {category} (confidence {confidence:.2f})")
+            if category is not None and confidence >= self.intent_threshold:
+                return {"classification": category, "confidence": confidence, "source": "embedding"}
+
+        # Joins other requests arriving within batch_wait
+        classification = self.batcher.submit(user_input).result()
+        return {"classification": classification, "confidence": confidence, "source": "model"}
 
     def manual_classification(self, user_input: str) -> str:
         text = user_input.lower().strip()
 
-        iot_keywords = [
-            "ligue", "desligue", "acenda", "apague",
-            "led", "servo", "angulo", "ângulo",
-            "temperatura", "umidade", "humidade",
-            "dht11", "sensor", "ldr", "pomodoro",
-            "comece", "inicie", "pare", "status",
-            "pwm", "gpio", "motor", "acionar"
-        ]
-        if any(kw in text for kw in iot_keywords):
+        if any(kw in text for kw in IOT_KEYWORDS):
             return "iot"
 
         # Regras para Documentação
-        documentation_keywords = [
-        "franzininho", "datasheet", "pino", "pinos",
-        "wifi lab", "lab01", "tutorial", "especificação",
-        "documentação", "qual pino", "como funciona"
-        ]   
-        if any(kw in text for kw in documentation_keywords):
+        if any(kw in text for kw in DOCUMENTATION_KEYWORDS):
             return "documentation"
 
         # Caso não bata com nada
@@ -0,0 +1,182 @@
+import itertools
+import operator
+import re
+import threading
+import time
+from commands import CommandCompiler
+from ollama_client import OllamaError
+from scheduler import PRIORITY_HIGH
+from structured import repair_json, token_budget, validate
+
+# Sensor fields a condition can test, as named in the device state
+SENSOR_FIELDS = ("temperature", "humidity", "ldr_value", "btn_pressed")
+
+# Actuators a rule can set, response field -> device state field
+ACTUATOR_FIELDS = {"red_led": "led_red", "blue_led": "led_blue", "green_led": "led_green", "servo_angle": "servo_angle"}
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le, "==": operator.eq, "!=": operator.ne}
+
+# "se a temperatura passar de 20, ligue o led azul", "turn on the blue led when the button is pressed"
+CONDITIONAL_WORDS = re.compile(r"\b(se|if|quando|when|sempre que|whenever|caso)\b")
+ACTUATOR_WORDS = re.compile(r"\b(leds?|servo)\b")
+
+RULE_SYSTEM_PROMPT = """You compile IoT automation requests into a rule. Always respond ONLY with valid JSON.
+RULES:
+1. "conditions": every condition must hold for the rule to fire (AND).
+   "field" is one of temperature (°C), humidity (%), ldr_value (light sensor, raw ADC reading), btn_pressed (1 pressed, 0 released).
+   "op" is one of > >= < <= == !=.
+2. "actions": only the actuators the user asked to change: red_led, green_led, blue_led (true = on) and servo_angle (0 to 180).
+3. "message": one short sentence describing the rule, in the user's language.
+4. If the request has no condition on a sensor, return an empty "conditions" list.
+"""
+
+RULE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "conditions": {
+            "type": "array",
+            "maxItems": 4,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "field": {"type": "string", "enum": list(SENSOR_FIELDS)},
+                    "op": {"type": "string", "enum": list(OPERATORS)},
+                    "value": {"type": "number"}
+                },
+                "required": ["field", "op", "value"]
+            }
+        },
+        "actions": {
+            "type": "object",
+            "properties": {
+                "red_led": {"type": "boolean"},
+                "green_led": {"type": "boolean"},
+                "blue_led": {"type": "boolean"},
+                "servo_angle": {"type": "integer", "minimum": 0, "maximum": 180}
+            }
+        },
+        "message": {"type": "string", "maxLength": 200}
+    },
+    "required": ["conditions", "actions", "message"]
+}
+
+
+class RuleEngine:
+    """
+    Conditional IoT requests compiled once by the SLM into
+    {"conditions": [{"field", "op", "value"}], "actions": {...}} and then
+    checked in Python on every state update of the device.
+    A rule fires when its conditions go from false to true, so a sensor that
+    stays above the threshold does not resend the command. Fired actions wait
+    in a per-device outbox until the board picks them up (telemetry response).
+    """
+
+    def __init__(self, client, model, max_rules=16):
+        self.client = client
+        self.model = model
+        self.max_rules = max_rules
+        self.num_predict = token_budget(RULE_SCHEMA)
+        self.normalize = CommandCompiler().normalize
+        self.rules = {}
+        self.outbox = {}
+        self.ids = itertools.count(1)
+        self.fired = 0
+        self.lock = threading.Lock()
+
+    def is_conditional(self, user_input):
+        """Worth compiling: a condition and an actuator, and not a question"""
+        text = self.normalize(user_input)
+        return "?" not in text and bool(CONDITIONAL_WORDS.search(text)) and bool(ACTUATOR_WORDS.search(text))
+
+    def compile(self, user_input):
+        """Rule dict for a conditional request, or None when the SLM output is not a usable rule"""
+        try:
+            response = self.client.generate(
+                {
+                    "model": self.model,
+                    "system": RULE_SYSTEM_PROMPT,
+                    "prompt": f'USER INPUT: "{user_input}"',
+                    "format": RULE_SCHEMA,
+                    "options": {"temperature": 0.0, "num_predict": self.num_predict}
+                },
+                priority=PRIORITY_HIGH
+            )
+        except OllamaError as e:
+            print(str(e))
+            return None
+        rule = repair_json(response.get("response", ""))
+        problems = validate(rule, RULE_SCHEMA) if rule is not None else ["response is not valid JSON"]
+        if not problems and not rule["conditions"]:
+            problems.append("$.conditions is empty")
+        if not problems and not rule["actions"]:
+            problems.append("$.actions is empty")
+        if problems:
+            print(f"Rule compilation failed ({problems[0]}): {response.get('response', '')}")
+            return None
+        print(f"Rule compiled: {rule}")
+        return {
+            "text": user_input,
+            "conditions": rule["conditions"],
+            "actions": {name: value for name, value in rule["actions"].items() if name in ACTUATOR_FIELDS},
+            "message": rule["message"]
+        }
+
+    def matches(self, rule, state):
+        for condition in rule["conditions"]:
+            value = state.get(condition["field"])
+            if value is None or not OPERATORS[condition["op"]](float(value), condition["value"]):
+                return False
+        return True
+
+    def add(self, device_id, rule, state):
+        """Store the rule for the device, returns (rule, active): active when it already holds for `state`"""
+        active = self.matches(rule, state)
+        with self.lock:
+            rule = dict(rule, id=next(self.ids), created=time.time(), active=active, fired=0)
+            rules = self.rules.setdefault(device_id, [])
+            rules.append(rule)
+            del rules[:-self.max_rules]
+        return rule, active
+
+    def remove(self, device_id, rule_id):
+        with self.lock:
+            rules = self.rules.get(device_id, [])
+            kept = [rule for rule in rules if rule["id"] != rule_id]
+            self.rules[device_id] = kept
+            return len(kept) != len(rules)
+
+    def device_rules(self, device_id):
+        with self.lock:
+            return [dict(rule) for rule in self.rules.get(device_id, [])]
+
+    def apply(self, actions, state):
+        """Actuator state after `actions`, in response field names"""
+        applied = {name: state.get(field) for name, field in ACTUATOR_FIELDS.items()}
+        applied.update(actions)
+        return applied
+
+    def evaluate(self, device_id, state):
+        """Check the device rules against its new state and queue the actions of the rules that fired"""
+        with self.lock:
+            for rule in self.rules.get(device_id, ()):
+                active = self.matches(rule, state)
+                if active and not rule["active"]:
+                    rule["fired"] += 1
+                    self.fired += 1
+                    outbox = self.outbox.setdefault(device_id, {"actions": {}, "messages": []})
+                    outbox["actions"].update(rule["actions"])
+                    outbox["messages"].append(rule["message"])
+                    print(f"Rule {rule['id']} fired for {device_id}: {rule['actions']}")
+                rule["active"] = active
+
+    def pending(self, device_id):
+        """Actions fired since the last call, {} when there are none"""
+        with self.lock:
+            outbox = self.outbox.pop(device_id, None)
+        if not outbox:
+            return {}
+        return {"actions": outbox["actions"], "message": " ".join(outbox["messages"])}
+
+    def stats(self):
+        with self.lock:
+            return {"rules": sum(len(rules) for rules in self.rules.values()), "fired": self.fired}
@@ -0,0 +1,55 @@
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent requests and resolves them together.
+    A batch closes `max_wait` seconds after its first item arrives or when it
+    holds `max_batch` items, then handler(items) -> results (same order) runs
+    once for the whole batch. With several workers, a new batch can form
+    while the previous one is still being resolved.
+    """
+
+    def __init__(self, handler, max_batch=16, max_wait=0.01, workers=1, name="micro-batcher"):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = Queue()
+        self.stats = {"items": 0, "batches": 0}
+        self.stats_lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self.worker, name=f"{name}-{i}", daemon=True).start()
+
+    def submit(self, item):
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def worker(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except Empty:
+                    break
+
+            with self.stats_lock:
+                self.stats["items"] += len(batch)
+                self.stats["batches"] += 1
+            items = [item for item, _ in batch]
+            try:
+                results = self.handler(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,58 @@
+"""
+RAG ingestion benchmark against MockOllama.
+
+Usage: python benchmarks/ingest_bench.py [--documents 200] [--embed-latency 0.005]
+
+Builds a synthetic text corpus and times RAG.create_vectorstore(recreate=True)
+in a temporary directory, so the numbers cover loading, splitting, batched
+embedding calls and vectorstore writes with a fixed embedding speed.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_ollama import MockOllama, synthetic_documents
+from report import rss_mb
+from ollama_client import OllamaClient
+from rag import RAG
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--sentences", type=int, default=40, help="sentences per document")
+    parser.add_argument("--embed-latency", type=float, default=0.005)
+    parser.add_argument("--retriever", default="chroma", choices=["chroma", "numpy"])
+    args = parser.parse_args()
+
+    mock = MockOllama(embed_latency=args.embed_latency, latency=0)
+    client = OllamaClient(host=mock.start())
+    documents = synthetic_documents(args.documents, args.sentences)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        rag = RAG(
+            persist_dir=os.path.join(workdir, "chroma_db"),
+            model="gemma3",
+            urls=[],
+            pdfs=[],
+            text=[],
+            client=client,
+            embedding_cache_path=os.path.join(workdir, "embedding_cache.db"),
+            retriever_backend=args.retriever
+        )
+        start = time.time()
+        rag.create_vectorstore(text=documents, recreate=True)
+        elapsed = time.time() - start
+
+    mock.stop()
+    print(f"\n{args.documents} documents ingested in {elapsed:.2f}s ({args.documents / elapsed:.1f} documents/s)")
+    print(f"Peak RSS: {rss_mb():.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
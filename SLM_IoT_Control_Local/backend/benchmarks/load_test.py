@@ -0,0 +1,220 @@
+"""
+Load test for the Flask backend with simulated boards.
+
+Usage:
+    python benchmarks/load_test.py --spawn [--boards 32] [--duration 30]
+    python benchmarks/load_test.py --server http://localhost:5000
+
+With --spawn a MockOllama and a server.py process pointing at it are started,
+so the numbers measure the backend only (serialization, locking, connection
+handling) against a fixed model speed. The spawned server listens on a free
+port and keeps its embedding cache and vector store in a temporary
+directory, indexing a synthetic local corpus instead of the documentation
+URLs, so the mock's vectors never reach the real ones and no network is
+needed. Each board uses the two-step API: POST /classification, then
+POST /ollama with the result. A board that gets an error backs off before
+its next command.
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_ollama import MockOllama, synthetic_documents
+from report import print_latencies, rss_mb
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Serial monitor commands, by how often boards send them
+COMMANDS = {
+    "iot": [
+        "Ligue o LED azul",
+        "Desligue todos os leds",
+        "Coloque o servo em 90 graus",
+        "Inicie um pomodoro de 25 minutos",
+        "Acenda a luz vermelha se estiver escuro",
+        "O ambiente está bom para estudar?",
+    ],
+    "documentation": [
+        "Qual microcontrolador da Franzininho?",
+        "Em qual GPIO fica o LED da Franzininho WiFi LAB01?",
+        "Como gravar o firmware na Franzininho?",
+    ],
+    "general": [
+        "Qual a capital do Brasil?",
+        "Me conte uma curiosidade sobre eletrônica",
+    ],
+}
+DEFAULT_MIX = "iot=0.7,documentation=0.2,general=0.1"
+
+# Wait after a failed request, doubled on each consecutive failure
+BACKOFF_MIN = 0.1
+BACKOFF_MAX = 5.0
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(","):
+        category, _, weight = item.partition("=")
+        mix[category.strip()] = float(weight)
+    return mix
+
+
+def board_state(rng):
+    return {
+        "temperature": round(rng.uniform(18, 32), 1),
+        "humidity": round(rng.uniform(30, 80), 1),
+        "btn_pressed": rng.random() < 0.1,
+        "led_red": rng.random() < 0.3,
+        "led_blue": rng.random() < 0.3,
+        "led_green": rng.random() < 0.3,
+        "ldr_value": rng.randint(0, 4095),
+        "servo_angle": rng.randrange(0, 181, 15),
+    }
+
+
+class Board(threading.Thread):
+    def __init__(self, index, server, mix, deadline, results, lock):
+        super().__init__(name=f"board-{index}", daemon=True)
+        self.server = server
+        self.mix = mix
+        self.deadline = deadline
+        self.results = results
+        self.lock = lock
+        self.rng = random.Random(index)
+        self.session = requests.Session()
+
+    def post(self, route, body):
+        start = time.perf_counter()
+        try:
+            response = self.session.post(f"{self.server}{route}", json=body, timeout=300)
+            ok = response.status_code == 200
+            data = response.json() if ok else {}
+        except (requests.RequestException, ValueError):
+            ok, data = False, {}
+        self.record(route, time.perf_counter() - start, ok)
+        return data if ok else None
+
+    def record(self, name, seconds, ok=True):
+        with self.lock:
+            self.results[name if ok else f"{name} (error)"].append(seconds)
+
+    def run(self):
+        categories, weights = zip(*self.mix.items())
+        backoff = BACKOFF_MIN
+        while time.time() < self.deadline:
+            category = self.rng.choices(categories, weights)[0]
+            body = dict(board_state(self.rng), user_input=self.rng.choice(COMMANDS[category]))
+            start = time.perf_counter()
+            result = self.post("/classification", body)
+            if result is not None:
+                body["classification"] = result["classification"].strip().lower().strip(".")
+                result = self.post("/ollama", body)
+            if result is None:
+                # A down or overloaded server is not hammered in a tight loop
+                time.sleep(min(backoff, max(0, self.deadline - time.time())))
+                backoff = min(backoff * 2, BACKOFF_MAX)
+                continue
+            backoff = BACKOFF_MIN
+            self.record("end-to-end", time.perf_counter() - start)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(ollama_host, port, workdir, documents=50):
+    """server.py against the mock, with every file it writes and its RAG corpus kept in `workdir`"""
+    corpus = os.path.join(workdir, "corpus")
+    os.makedirs(corpus)
+    for i, document in enumerate(synthetic_documents(documents, sentences=20)):
+        with open(os.path.join(corpus, f"doc{i:04d}.txt"), "w", encoding="utf-8") as f:
+            f.write(document)
+    env = dict(
+        os.environ,
+        OLLAMA_HOST=ollama_host,
+        OLLAMA_HOSTS=ollama_host,
+        MQTT_HOST="",
+        PORT=str(port),
+        EMBEDDING_CACHE_PATH=os.path.join(workdir, "embedding_cache.db"),
+        RAG_PERSIST_DIR=os.path.join(workdir, "chroma_db"),
+        RAG_URLS="",
+        RAG_PDFS="",
+        RAG_TEXT_DIR=corpus
+    )
+    process = subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, "server.py")], cwd=workdir, env=env)
+    server = f"http://localhost:{port}"
+    # The server binds right away, RAG ingestion continues in the background
+    for _ in range(600):
+        if process.poll() is not None:
+            raise RuntimeError("server.py exited during startup")
+        try:
+            requests.get(f"{server}/metrics", timeout=1)
+            return process, server
+        except requests.RequestException:
+            time.sleep(1)
+    process.terminate()
+    raise RuntimeError("server.py did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--server", default="http://localhost:5000")
+    parser.add_argument("--spawn", action="store_true", help="start MockOllama and server.py")
+    parser.add_argument("--boards", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"category weights (default {DEFAULT_MIX})")
+    parser.add_argument("--token-rate", type=float, default=30.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    mock = process = workdir = None
+    server = args.server
+    if args.spawn:
+        workdir = tempfile.TemporaryDirectory()
+        mock = MockOllama(token_rate=args.token_rate, latency=args.latency)
+        process, server = spawn_server(mock.start(), free_port(), workdir.name)
+
+    try:
+        results = defaultdict(list)
+        lock = threading.Lock()
+        deadline = time.time() + args.duration
+        boards = [Board(i, server, parse_mix(args.mix), deadline, results, lock) for i in range(args.boards)]
+        start = time.time()
+        for board in boards:
+            board.start()
+        for board in boards:
+            board.join()
+        elapsed = time.time() - start
+
+        completed = len(results["end-to-end"])
+        errors = sum(len(v) for k, v in results.items() if k.endswith("(error)"))
+        print(f"\n{args.boards} boards, {elapsed:.1f}s, mix {args.mix}")
+        print(f"Throughput: {completed / elapsed:.2f} commands/s, {errors} failed requests")
+        print_latencies(sorted(results.items()))
+        if process:
+            print(f"Server RSS: {rss_mb(process.pid):.1f} MB")
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        if mock:
+            mock.stop()
+        if workdir:
+            workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
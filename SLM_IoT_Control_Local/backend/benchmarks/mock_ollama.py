@@ -0,0 +1,193 @@
+"""
+Stand-in for the Ollama HTTP API, so the backend can be benchmarked without a model.
+
+Usage: python benchmarks/mock_ollama.py [--port 11435] [--token-rate 30] [--latency 0.05]
+Then start the backend with OLLAMA_HOST=http://localhost:11435.
+
+Implements /api/generate (blocking and streaming), /api/embed, /api/embeddings
+and /api/tags. Generation waits `latency` seconds (prompt evaluation) and then
+emits tokens at `token_rate` tokens/s, so results reflect backend overhead on
+top of a known, fixed model speed.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CORPUS = [
+    "A Franzininho WiFi usa o ESP32-S2, um microcontrolador de 240 MHz com WiFi integrado.",
+    "The LED is connected to GPIO 12 and the servo signal to GPIO 14.",
+    "O ambiente está adequado para estudo: temperatura e umidade dentro da faixa ideal.",
+    "Pomodoro iniciado. Bons estudos!",
+]
+
+
+def synthetic_documents(count, sentences, seed=42):
+    """Text documents built from DEFAULT_CORPUS, for ingesting without the real sources"""
+    rng = random.Random(seed)
+    return [
+        f"Documento {i}. " + " ".join(f"{rng.choice(DEFAULT_CORPUS)} (GPIO {rng.randint(0, 45)})" for _ in range(sentences))
+        for i in range(count)
+    ]
+
+
+class MockOllama:
+    def __init__(self, port=11435, token_rate=30.0, latency=0.05, embed_latency=0.005, dimensions=768, corpus=None, seed=42):
+        self.port = port
+        self.token_rate = token_rate
+        self.latency = latency
+        self.embed_latency = embed_latency
+        self.dimensions = dimensions
+        self.corpus = corpus or DEFAULT_CORPUS
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def host(self):
+        return f"http://localhost:{self.port}"
+
+    def start(self):
+        """Serve in a background thread, returns the host URL"""
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self.send_json({"models": [{"name": "gemma3"}, {"name": "nomic-embed-text"}]})
+                else:
+                    self.send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path == "/api/generate":
+                    mock.generate(self, payload)
+                elif self.path == "/api/embed":
+                    texts = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+                    time.sleep(mock.embed_latency * len(texts))
+                    self.send_json({"model": payload.get("model"), "embeddings": [mock.embedding(t) for t in texts]})
+                elif self.path == "/api/embeddings":
+                    time.sleep(mock.embed_latency)
+                    self.send_json({"embedding": mock.embedding(payload.get("prompt", ""))})
+                else:
+                    self.send_json({"error": "not found"}, 404)
+
+            def send_json(self, body, status=200):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("0.0.0.0", self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="mock-ollama", daemon=True).start()
+        return self.host
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def embedding(self, text):
+        """Deterministic unit vector derived from the text"""
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        vector = [rng.gauss(0, 1) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1
+        return [v / norm for v in vector]
+
+    def output(self, payload):
+        """Response text shaped like what each backend prompt expects"""
+        with self.lock:
+            choice = self.random.random()
+            sentence = self.random.choice(self.corpus)
+            leds = [self.random.random() < 0.3 for _ in range(3)]
+            angle = self.random.randrange(0, 181, 15)
+        system = payload.get("system", "")
+        if "classif" in system.lower():
+            return ["iot", "documentation", "general"][int(choice * 3)]
+        if payload.get("format"):
+            return json.dumps({
+                "leds": {"red_led": leds[0], "green_led": leds[1], "blue_led": leds[2]},
+                "servo_angle": angle,
+                "pomodoro": {"start": choice < 0.1, "stop": False, "minutes": 25 if choice < 0.1 else 0},
+                "message": sentence
+            })
+        return sentence
+
+    def tokens(self, payload):
+        """Split the output into ~4 character tokens, capped by num_predict"""
+        text = self.output(payload)
+        tokens = [text[i:i + 4] for i in range(0, len(text), 4)]
+        limit = payload.get("options", {}).get("num_predict")
+        return tokens[:limit] if limit and limit > 0 else tokens
+
+    def generate(self, handler, payload):
+        tokens = self.tokens(payload)
+        prompt_tokens = len(payload.get("system", "") + payload.get("prompt", "")) // 4
+        time.sleep(self.latency)
+        stats = {
+            "model": payload.get("model"),
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.latency * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(len(tokens) / self.token_rate * 1e9),
+        }
+
+        if payload.get("stream") is False:
+            time.sleep(len(tokens) / self.token_rate)
+            handler.send_json(dict(stats, response="".join(tokens)))
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        for token in tokens:
+            time.sleep(1 / self.token_rate)
+            self.write_chunk(handler, {"model": payload.get("model"), "response": token, "done": False})
+        self.write_chunk(handler, dict(stats, response=""))
+        handler.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, handler, body):
+        data = (json.dumps(body) + "\n").encode("utf-8")
+        handler.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        handler.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-rate", type=float, default=30.0, help="generated tokens per second")
+    parser.add_argument("--latency", type=float, default=0.05, help="prompt evaluation time per generation (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="time per embedded text (s)")
+    parser.add_argument("--corpus", help="text file, one candidate answer per line")
+    args = parser.parse_args()
+
+    corpus = None
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    mock = MockOllama(args.port, args.token_rate, args.latency, args.embed_latency, corpus=corpus)
+    print(f"Mock Ollama listening on {mock.start()}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
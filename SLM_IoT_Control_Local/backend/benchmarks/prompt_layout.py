@@ -0,0 +1,92 @@
+"""
+Compares the old single-prompt IoT layout (live sensor values before the
+rules) with the current layout (static IOT_SYSTEM_PROMPT + variable suffix).
+
+Usage: python benchmarks/prompt_layout.py [--host http://localhost:11434] [--runs 20]
+
+Each run changes the sensor values, like the device does between requests.
+Ollama only re-evaluates the tokens after the first difference, which shows
+up as a lower prompt_eval_count / prompt_eval_duration for the new layout.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iot import IOT, IOT_SYSTEM_PROMPT
+from ollama_client import OllamaClient
+
+
+def legacy_prompt(temp, hum, button_state, ledRed, ledBlue, ledGreen, ldrValue, servoAngle, user_input):
+    """Prompt layout used before the static prefix was split out"""
+    return f"""
+You are an IoT SLM controller. Always respond ONLY with valid JSON.
+SYSTEM STATUS:
+- temperature: {temp:.1f}
+- humidity: {hum:.1f}
+- button_pressed: {str(button_state).lower()}
+- leds: red={str(ledRed).lower()}, blue={str(ledBlue).lower()}, green={str(ledGreen).lower()}
+- ldr_value: {ldrValue}
+- servo_angle: {servoAngle}
+RULES:
+{IOT_SYSTEM_PROMPT.split("RULES:", 1)[1]}
+USER INPUT: "{user_input}"
+
+"""
+
+
+def sample_state(rng):
+    return (
+        round(rng.uniform(18, 32), 1),
+        round(rng.uniform(30, 80), 1),
+        rng.choice([True, False]),
+        rng.choice([True, False]),
+        rng.choice([True, False]),
+        rng.choice([True, False]),
+        rng.randint(0, 4095),
+        rng.randint(0, 180),
+        "How is the study environment?"
+    )
+
+
+def run(client, model, runs, layout, seed):
+    rng = random.Random(seed)
+    iot = IOT(model=model, client=client)
+    counts, durations = [], []
+    for _ in range(runs):
+        state = sample_state(rng)
+        if layout == "legacy":
+            payload = {"model": model, "prompt": legacy_prompt(*state), "format": "json"}
+        else:
+            payload = {"model": model, "system": IOT_SYSTEM_PROMPT, "prompt": iot.create_interactive_prompt(*state), "format": "json"}
+        # Only the prompt evaluation matters here
+        payload["options"] = {"num_predict": 1}
+        body = client.generate(payload)
+        counts.append(body.get("prompt_eval_count", 0))
+        durations.append(body.get("prompt_eval_duration", 0) / 1e6)
+    return counts, durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=os.getenv("OLLAMA_HOST", "http://localhost:11434"))
+    parser.add_argument("--model", default="gemma3")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    client = OllamaClient(host=args.host, max_generations=1, keep_alive={"*": "10m"})
+    # Warm-up so model loading is not counted
+    client.generate({"model": args.model, "prompt": "ok", "options": {"num_predict": 1}})
+
+    print(f"{'layout':<8} {'eval tokens (mean)':>20} {'eval ms (mean)':>16} {'eval ms (median)':>18}")
+    for layout in ("legacy", "split"):
+        counts, durations = run(client, args.model, args.runs, layout, args.seed)
+        print(f"{layout:<8} {statistics.mean(counts):>20.1f} {statistics.mean(durations):>16.1f} {statistics.median(durations):>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
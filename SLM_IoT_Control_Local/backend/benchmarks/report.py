@@ -0,0 +1,33 @@
+import resource
+
+
+def percentile(values, q):
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def rss_mb(pid=None):
+    """Resident memory of `pid` (Linux /proc), or peak RSS of this process"""
+    if pid is not None:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def print_latencies(rows):
+    """rows: [(name, [seconds])]"""
+    print(f"{'':<16} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, values in rows:
+        print(
+            f"{name:<16} {len(values):>7} "
+            f"{percentile(values, 50) * 1000:>9.1f} {percentile(values, 90) * 1000:>9.1f} "
+            f"{percentile(values, 99) * 1000:>9.1f} {max(values, default=0) * 1000:>9.1f}"
+        )
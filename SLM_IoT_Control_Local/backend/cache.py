@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+class LRUCache:
+    """Thread-safe LRU cache with optional TTL and hit/miss counters"""
+
+    def __init__(self, maxsize=256, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.time() - stored_at <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self.entries),
+            }
+
+
+class SemanticCache:
+    """
+    Near-duplicate lookup: returns the value stored for the most similar
+    previous embedding when its cosine similarity reaches `threshold`.
+    Only entries stored with the same `group` are candidates (RAG uses the
+    retrieved chunk ids, so an answer is reused only over the same context).
+    Bounded like LRUCache, entries are keyed so a repeated question replaces
+    its previous entry.
+    """
+
+    def __init__(self, maxsize=256, ttl=None, threshold=0.95):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, vector, default=None, group=None):
+        query = np.array(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+        with self.lock:
+            now = time.time()
+            if self.ttl is not None:
+                for key in [k for k, (_, _, stored_at, _) in self.entries.items() if now - stored_at > self.ttl]:
+                    del self.entries[key]
+            keys = [k for k, entry in self.entries.items() if entry[3] == group]
+            if keys:
+                scores = np.stack([self.entries[k][0] for k in keys]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return self.entries[keys[best]][1]
+            self.misses += 1
+            return default
+
+    def put(self, key, vector, value, group=None):
+        normalized = np.array(vector, dtype=np.float32)
+        normalized /= np.linalg.norm(normalized) or 1
+        with self.lock:
+            self.entries[key] = (normalized, value, time.time(), group)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self.entries),
+            }
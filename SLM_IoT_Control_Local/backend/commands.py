@@ -0,0 +1,161 @@
+import json
+import re
+import unicodedata
+from agent import IOT_KEYWORDS
+
+LED_COLORS = {
+    "vermelho": "red", "vermelha": "red", "red": "red",
+    "azul": "blue", "blue": "blue",
+    "verde": "green", "green": "green",
+}
+ALL_WORDS = {"todos", "todas", "all"}
+
+ON_WORDS = {"ligue", "liga", "ligar", "acenda", "acende", "acender", "acione", "acionar"}
+OFF_WORDS = {"desligue", "desliga", "desligar", "apague", "apaga", "apagar"}
+START_WORDS = {"inicie", "inicia", "iniciar", "comece", "comeca", "comecar", "start", "begin"}
+STOP_WORDS = {"pare", "parar", "encerre", "encerrar", "cancele", "cancelar", "stop"}
+SERVO_WORDS = {"coloque", "coloca", "mova", "move", "gire", "gira", "ajuste", "servo", "set", "turn", "rotate"}
+
+# Questions, conditionals and deferred actions need the model
+UNSURE_WORDS = {
+    "se", "if", "quando", "when", "qual", "quais", "como", "what", "how", "porque", "why",
+    "depois", "amanha", "daqui", "later", "tomorrow",
+}
+
+# Negated commands ("não ligue o led", "don't turn on") need the model
+NEGATION = re.compile(r"\b(nao|not|nunca|never|don['’]?t)\b")
+
+HOUR_WORDS = {"h", "hora", "horas", "hour", "hours"}
+MINUTES = re.compile(r"(\d+)\s*(?:min|minuto|minutos|minute|minutes)\b")
+
+# A servo angle has a degree unit ("90 graus", "90°") or ends the command right
+# after servo/para/em ("servo 90", "coloque o servo em 90"); "gire o servo 2 vezes" does not
+DEGREES = re.compile(r"(-?)(\d+)\s*(?:°|graus?\b|degrees?\b)")
+SERVO_POSITION = re.compile(r"\b(?:servo|para|em|to)\s+(-?)(\d+)\s*[.!]*$")
+
+ENGLISH_WORDS = {"turn", "switch", "red", "blue", "green", "all", "start", "begin", "stop", "set", "rotate", "degrees"}
+
+DEFAULT_POMODORO_MINUTES = 25
+
+
+class CommandCompiler:
+    """
+    Rule-based parser for the common IoT commands ("ligue o led vermelho",
+    "servo 90 graus", "inicie pomodoro 25 minutos").
+    compile() returns the same tuple as IOT.parse_interactive_response plus the
+    equivalent raw JSON, or None when the input is not an unambiguous command
+    and the SLM has to handle it.
+    """
+
+    def normalize(self, user_input):
+        text = unicodedata.normalize("NFKD", user_input.lower())
+        return "".join(c for c in text if not unicodedata.combining(c))
+
+    def compile(self, body):
+        user_input = body["user_input"]
+        if "?" in user_input or not any(kw in user_input.lower() for kw in IOT_KEYWORDS):
+            return None
+
+        text = self.normalize(user_input)
+        words = re.findall(r"[a-z]+|\d+", text)
+        word_set = set(words)
+        if word_set & UNSURE_WORDS or NEGATION.search(text):
+            return None
+
+        english = bool(word_set & ENGLISH_WORDS)
+        leds = (bool(body["led_red"]), bool(body["led_blue"]), bool(body["led_green"]))
+        servo_angle = int(body["servo_angle"])
+        pomodoro = (False, False, 0)
+
+        has_led = "led" in word_set or "leds" in word_set
+        has_servo = "servo" in word_set
+        has_pomodoro = "pomodoro" in word_set
+        # One intent per command, anything else goes to the SLM
+        if has_led + has_servo + has_pomodoro != 1:
+            return None
+
+        if has_led:
+            leds = self.compile_leds(text, word_set, leds)
+            if leds is None:
+                return None
+            message = self.led_message(leds, english)
+        elif has_servo:
+            servo_angle = self.compile_servo(text, word_set)
+            if servo_angle is None:
+                return None
+            message = f"Servo set to {servo_angle} degrees." if english else f"Servo ajustado para {servo_angle} graus."
+        else:
+            pomodoro = self.compile_pomodoro(text, word_set)
+            if pomodoro is None:
+                return None
+            if pomodoro[0]:
+                message = f"Pomodoro started for {pomodoro[2]} minutes." if english else f"Pomodoro de {pomodoro[2]} minutos iniciado."
+            else:
+                message = "Pomodoro stopped." if english else "Pomodoro encerrado."
+
+        response = json.dumps({
+            "leds": {"red_led": leds[0], "green_led": leds[2], "blue_led": leds[1]},
+            "servo_angle": servo_angle,
+            "pomodoro": {"start": pomodoro[0], "stop": pomodoro[1], "minutes": pomodoro[2]},
+            "message": message,
+        })
+        return message, leds, servo_angle, pomodoro, response
+
+    def compile_leds(self, text, word_set, leds):
+        # A number in a LED command is a delay or a time ("em 10 minutos", "às 10 horas")
+        if re.search(r"\d", text):
+            return None
+        turn_on = bool(word_set & ON_WORDS) or bool(re.search(r"\b(turn|switch) on\b", text))
+        turn_off = bool(word_set & OFF_WORDS) or bool(re.search(r"\b(turn|switch) off\b", text))
+        if turn_on == turn_off:
+            return None
+
+        if word_set & ALL_WORDS:
+            colors = {"red", "blue", "green"}
+        else:
+            colors = {LED_COLORS[word] for word in word_set if word in LED_COLORS}
+        if not colors:
+            return None
+
+        red, blue, green = leds
+        if turn_on:
+            # Only the requested LEDs stay on (prompt rule 5)
+            return "red" in colors, "blue" in colors, "green" in colors
+        return (red and "red" not in colors, blue and "blue" not in colors, green and "green" not in colors)
+
+    def led_message(self, leds, english):
+        names = ("red", "blue", "green") if english else ("vermelho", "azul", "verde")
+        on = [name for name, state in zip(names, leds) if state]
+        if english:
+            return f"LEDs on: {', '.join(on)}." if on else "All LEDs off."
+        return f"LEDs ligados: {', '.join(on)}." if on else "Todos os LEDs desligados."
+
+    def compile_servo(self, text, word_set):
+        numbers = re.findall(r"\d+", text)
+        if len(numbers) != 1 or not word_set & SERVO_WORDS:
+            return None
+        match = DEGREES.search(text) or SERVO_POSITION.search(text.strip())
+        # Negative angles are out of range, not a sign to drop
+        if match is None or match.group(1):
+            return None
+        angle = int(match.group(2))
+        if angle > 180:
+            return None
+        return angle
+
+    def compile_pomodoro(self, text, word_set):
+        start = bool(word_set & START_WORDS)
+        stop = bool(word_set & STOP_WORDS)
+        if start == stop:
+            return None
+        if stop:
+            return False, True, 0
+
+        # Only a number followed by a minute unit is a duration, hours or a start time go to the SLM
+        minutes = MINUTES.findall(text)
+        if word_set & HOUR_WORDS or len(minutes) > 1 or len(minutes) != len(re.findall(r"\d+", text)):
+            return None
+        minutes = int(minutes[0]) if minutes else DEFAULT_POMODORO_MINUTES
+        if not 0 < minutes <= 120:
+            return None
+        return True, False, minutes
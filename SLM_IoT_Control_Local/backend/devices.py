@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Sensor and actuator fields a board reports, as named in the request body
+DEVICE_FIELDS = ("temperature", "humidity", "btn_pressed", "led_red", "led_blue", "led_green", "ldr_value", "servo_angle")
+
+# Minimum change over the trend window to call a sensor rising/falling
+TREND_THRESHOLDS = {"temperature": 0.5, "humidity": 2.0, "ldr_value": 200}
+
+
+class DeviceStateStore:
+    """
+    Per-device state, keyed by device id.
+    Boards may send only the fields that changed: update() merges them into
+    the latest state and appends a timestamped snapshot to a bounded ring
+    buffer, which trends() reads. The least recently seen device is dropped
+    beyond `max_devices`.
+    """
+
+    def __init__(self, history=120, max_devices=256, trend_window=600):
+        self.history = history
+        self.max_devices = max_devices
+        self.trend_window = trend_window
+        self.devices = OrderedDict()
+        self.lock = threading.Lock()
+
+    def update(self, device_id, delta):
+        """Merge `delta` into the device state, returns the merged state"""
+        delta = {k: v for k, v in delta.items() if k in DEVICE_FIELDS}
+        with self.lock:
+            series = self.devices.get(device_id)
+            if series is None:
+                series = self.devices[device_id] = deque(maxlen=self.history)
+            self.devices.move_to_end(device_id)
+            while len(self.devices) > self.max_devices:
+                self.devices.popitem(last=False)
+
+            state = dict(series[-1][1]) if series else {}
+            if delta:
+                state.update(delta)
+                series.append((time.time(), state))
+            return dict(state)
+
+    def latest(self, device_id):
+        with self.lock:
+            series = self.devices.get(device_id)
+            return dict(series[-1][1]) if series else None
+
+    def samples(self, device_id, window=None):
+        """[(timestamp, state)] within the last `window` seconds, oldest first"""
+        since = time.time() - (window or self.trend_window)
+        with self.lock:
+            return [(t, dict(state)) for t, state in self.devices.get(device_id, ()) if t >= since]
+
+    def trends(self, device_id, window=None):
+        """{"temperature": "rising" | "falling" | "stable", ...} for sensors with at least two samples"""
+        samples = self.samples(device_id, window)
+        trends = {}
+        for field, threshold in TREND_THRESHOLDS.items():
+            values = [state[field] for _, state in samples if field in state]
+            if len(values) < 2:
+                continue
+            change = values[-1] - values[0]
+            trends[field] = "rising" if change >= threshold else "falling" if change <= -threshold else "stable"
+        return trends
+
+    def missing(self, state):
+        return [field for field in DEVICE_FIELDS if field not in state]
+
+    def stats(self):
+        with self.lock:
+            return {"devices": len(self.devices), "samples": sum(len(series) for series in self.devices.values())}
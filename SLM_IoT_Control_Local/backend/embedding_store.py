@@ -0,0 +1,107 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+
+
+class EmbeddingStore:
+    """
+    Disk-backed embedding cache keyed by (embed_model, sha256(text)).
+    Vectors are stored as float32 blobs in SQLite (WAL mode, so several
+    processes can share the file) and survive restarts. When the store grows
+    past `max_entries`, the least recently used vectors are evicted.
+    Hits do not write: their last_used times are kept in memory and written
+    in one batch every `touch_batch` hits or `touch_interval` seconds, and
+    before an eviction. The row count is kept in memory too, and only
+    re-read from SQLite when it says the store is full.
+    """
+
+    def __init__(self, path, max_entries=50000, touch_batch=256, touch_interval=30):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        self.touched = {}
+        self.last_flush = time.time()
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " text_hash TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " PRIMARY KEY (model, text_hash))"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self.count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def text_hash(self, text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model, texts):
+        """Return {text: vector} for the texts already stored"""
+        hashes = {self.text_hash(text): text for text in texts}
+        found = {}
+        with self.lock, self.conn:
+            keys = list(hashes)
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[hashes[text_hash]] = vector.tolist()
+                now = time.time()
+                for text_hash, _ in rows:
+                    self.touched[(model, text_hash)] = now
+            if len(self.touched) >= self.touch_batch or time.time() - self.last_flush >= self.touch_interval:
+                self.flush_touched()
+        return found
+
+    def put_many(self, model, items):
+        """Store (text, vector) pairs"""
+        now = time.time()
+        with self.lock, self.conn:
+            # The vector of a (model, text) never changes, a row already there is kept
+            cursor = self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, self.text_hash(text), array("f", vector).tobytes(), now) for text, vector in items]
+            )
+            self.count += max(cursor.rowcount, 0)
+            if self.count > self.max_entries:
+                self.evict()
+
+    def get(self, model, text):
+        return self.get_many(model, [text]).get(text)
+
+    def put(self, model, text, vector):
+        self.put_many(model, [(text, vector)])
+
+    def flush_touched(self):
+        """Write the buffered last_used times of cache hits"""
+        if self.touched:
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(used, model, text_hash) for (model, text_hash), used in self.touched.items()]
+            )
+            self.touched = {}
+        self.last_flush = time.time()
+
+    def evict(self):
+        self.flush_touched()
+        # Other processes sharing the file also insert: recount before deleting
+        self.count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self.count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (self.count - self.max_entries,)
+            )
+            self.count = self.max_entries
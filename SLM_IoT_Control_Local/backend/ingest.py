@@ -0,0 +1,151 @@
+import threading
+import time
+from queue import Queue, Empty
+
+DONE = object()
+
+
+class IngestPipeline:
+    """
+    Streaming ingestion: load -> split -> embed -> write.
+    Loaders and embedders run concurrently, split and write in one thread
+    each, and the stages are connected by bounded queues so a slow stage
+    blocks the upstream ones (backpressure) instead of buffering the whole
+    corpus in memory.
+
+    load(source) -> item or None        (loader_workers threads)
+    split(item) -> list of chunks       (1 thread, may keep state)
+    embed(chunks) -> vectors            (embed_workers threads, batches of embed_batch_size)
+    write(chunks, vectors)              (batches of write_batch_size)
+    Throughput is reported per stage: sources for load/split, chunks for embed/write.
+    """
+
+    def __init__(
+        self,
+        load,
+        split,
+        embed,
+        write,
+        loader_workers=4,
+        embed_workers=2,
+        embed_batch_size=64,
+        write_batch_size=256,
+        queue_size=4
+    ):
+        self.load = load
+        self.split = split
+        self.embed = embed
+        self.write = write
+        self.loader_workers = loader_workers
+        self.embed_workers = embed_workers
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.queue_size = queue_size
+        self.stats_lock = threading.Lock()
+
+    def run(self, sources):
+        self.error = None
+        self.stats = {name: {"items": 0, "busy": 0.0} for name in ("load", "split", "embed", "write")}
+        start_time = time.time()
+
+        source_queue = Queue()
+        for source in sources:
+            source_queue.put(source)
+        loaded_queue = Queue(maxsize=self.queue_size)
+        embed_queue = Queue(maxsize=self.queue_size)
+        write_queue = Queue(maxsize=self.queue_size)
+
+        threads = [
+            threading.Thread(target=self.loader, args=(source_queue, loaded_queue), name=f"ingest-load-{i}")
+            for i in range(self.loader_workers)
+        ]
+        threads += [
+            threading.Thread(target=self.embedder, args=(embed_queue, write_queue), name=f"ingest-embed-{i}")
+            for i in range(self.embed_workers)
+        ]
+        threads += [
+            threading.Thread(target=self.splitter, args=(loaded_queue, embed_queue), name="ingest-split"),
+            threading.Thread(target=self.writer, args=(write_queue,), name="ingest-write"),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.report(time.time() - start_time)
+        if self.error:
+            raise self.error
+        return self.stats
+
+    def timed(self, name, fn, *args, items=1):
+        """Run one unit of stage work, skipped once any stage has failed"""
+        if self.error:
+            return None
+        start_time = time.time()
+        try:
+            return fn(*args)
+        except Exception as e:
+            self.error = self.error or e
+            return None
+        finally:
+            with self.stats_lock:
+                self.stats[name]["busy"] += time.time() - start_time
+                self.stats[name]["items"] += items
+
+    def loader(self, source_queue, loaded_queue):
+        while True:
+            try:
+                source = source_queue.get_nowait()
+            except Empty:
+                break
+            item = self.timed("load", self.load, source)
+            if item is not None:
+                loaded_queue.put(item)
+        loaded_queue.put(DONE)
+
+    def splitter(self, loaded_queue, embed_queue):
+        batch = []
+        finished = 0
+        while finished < self.loader_workers:
+            item = loaded_queue.get()
+            if item is DONE:
+                finished += 1
+                continue
+            batch.extend(self.timed("split", self.split, item) or [])
+            while len(batch) >= self.embed_batch_size:
+                embed_queue.put(batch[:self.embed_batch_size])
+                batch = batch[self.embed_batch_size:]
+        if batch:
+            embed_queue.put(batch)
+        for _ in range(self.embed_workers):
+            embed_queue.put(DONE)
+
+    def embedder(self, embed_queue, write_queue):
+        while True:
+            batch = embed_queue.get()
+            if batch is DONE:
+                break
+            vectors = self.timed("embed", self.embed, batch, items=len(batch))
+            if vectors is not None:
+                write_queue.put((batch, vectors))
+        write_queue.put(DONE)
+
+    def writer(self, write_queue):
+        chunks, vectors = [], []
+        finished = 0
+        while finished < self.embed_workers:
+            item = write_queue.get()
+            if item is DONE:
+                finished += 1
+            else:
+                chunks.extend(item[0])
+                vectors.extend(item[1])
+            if len(chunks) >= self.write_batch_size or (finished == self.embed_workers and chunks):
+                self.timed("write", self.write, chunks, vectors, items=len(chunks))
+                chunks, vectors = [], []
+
+    def report(self, elapsed):
+        for name, stage in self.stats.items():
+            rate = stage["items"] / stage["busy"] if stage["busy"] else 0.0
+            print(f"[INGEST] {name}: {stage['items']} items, {stage['busy']:.2f}s busy, {rate:.1f} items/s")
+        print(f"[INGEST] pipeline finished in {elapsed:.2f} seconds")
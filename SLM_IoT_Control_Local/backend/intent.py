@@ -0,0 +1,135 @@
+import threading
+import numpy as np
+
+# Example inputs per category, averaged into one prototype vector each
+INTENT_EXAMPLES = {
+    "iot": [
+        "Ligue o LED vermelho",
+        "Desligue todos os leds",
+        "Coloque o servo em 90 graus",
+        "Inicie um pomodoro de 25 minutos",
+        "Pare o pomodoro",
+        "Qual a temperatura agora?",
+        "Como está a umidade da sala?",
+        "O ambiente está bom para estudar?",
+        "Acenda a luz se estiver escuro",
+        "Turn on the blue LED",
+        "Set the servo to 45 degrees",
+        "What is the humidity right now?",
+    ],
+    "documentation": [
+        "Qual microcontrolador da Franzininho?",
+        "Quais são os pinos da Franzininho WiFi LAB01?",
+        "Em qual GPIO fica o LED da placa?",
+        "Como gravar o firmware na Franzininho?",
+        "Onde encontro o datasheet do ESP32-S2?",
+        "Quais sensores vêm na Franzininho WiFi LAB01?",
+        "Tutorial de primeiros passos da Franzininho",
+        "What are the specifications of the Franzininho board?",
+        "Which pin is the buzzer connected to?",
+    ],
+    "general": [
+        "Qual a capital do Brasil?",
+        "Me conte uma piada",
+        "Quem descobriu a eletricidade?",
+        "Como fazer um bolo de chocolate?",
+        "Bom dia, tudo bem?",
+        "Me dê uma dica para estudar melhor",
+        "What is the meaning of life?",
+        "Who won the last World Cup?",
+    ],
+}
+
+
+class IntentClassifier:
+    """
+    Nearest-prototype classifier over query embeddings.
+    Each category's prototype is the normalized mean of its example
+    embeddings. classify() embeds the input once through the shared
+    embeddings (so retrieval finds the vector in the embedding store) and
+    returns the best category with a softmax confidence over the cosine
+    similarities, scaled by `temperature`. Unless given, the temperature is
+    fitted in build() by leave-one-out over the examples: each example is
+    scored against prototypes built without it, and the temperature with the
+    lowest log loss on its true category is kept, so the confidence compared
+    with the router's threshold tracks how often the prototype is right.
+    """
+
+    # Candidate softmax temperatures for the leave-one-out fit
+    TEMPERATURES = np.geomspace(0.005, 1.0, 60)
+
+    def __init__(self, embeddings, examples=None, temperature=None):
+        self.embeddings = embeddings
+        self.examples = examples or INTENT_EXAMPLES
+        self.temperature = temperature
+        self.categories = list(self.examples)
+        self.prototypes = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Compute the prototypes in the background so the first question does not wait"""
+        threading.Thread(target=self.build, name="intent-prototypes", daemon=True).start()
+
+    def build(self):
+        with self.lock:
+            if self.prototypes is not None:
+                return self.prototypes
+            try:
+                examples = []
+                for category in self.categories:
+                    vectors = np.array(self.embeddings.embed_documents(self.examples[category]), dtype=np.float32)
+                    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+                    examples.append(vectors)
+            except Exception as e:
+                print(f"Error building intent prototypes: {e}")
+                return None
+            prototypes = np.stack([self.normalized(vectors.sum(axis=0)) for vectors in examples])
+            if self.temperature is None:
+                self.temperature = self.fit_temperature(examples, prototypes)
+            self.prototypes = prototypes
+            print(f"[INFO] Intent prototypes ready for {', '.join(self.categories)} (temperature {self.temperature:.3f}).")
+            return self.prototypes
+
+    @staticmethod
+    def normalized(vector):
+        return vector / (np.linalg.norm(vector) or 1)
+
+    def fit_temperature(self, examples, prototypes):
+        """Temperature with the lowest leave-one-out log loss over the examples"""
+        scores, labels = [], []
+        for label, vectors in enumerate(examples):
+            if len(vectors) < 2:
+                continue  # No prototype left without the example
+            total = vectors.sum(axis=0)
+            for vector in vectors:
+                held_out = prototypes.copy()
+                held_out[label] = self.normalized(total - vector)
+                scores.append(held_out @ vector)
+                labels.append(label)
+        if not scores:
+            return 0.05
+        scores, labels = np.array(scores), np.array(labels)
+        losses = []
+        for temperature in self.TEMPERATURES:
+            scaled = scores / temperature
+            scaled -= scaled.max(axis=1, keepdims=True)
+            log_probabilities = scaled - np.log(np.exp(scaled).sum(axis=1, keepdims=True))
+            losses.append(-log_probabilities[np.arange(len(labels)), labels].mean())
+        return float(self.TEMPERATURES[int(np.argmin(losses))])
+
+    def classify(self, text):
+        """Returns (category, confidence), or (None, 0.0) when embeddings are unavailable"""
+        prototypes = self.prototypes if self.prototypes is not None else self.build()
+        if prototypes is None:
+            return None, 0.0
+        try:
+            vector = np.array(self.embeddings.embed_query(text), dtype=np.float32)
+        except Exception as e:
+            print(f"Error embedding input for intent classification: {e}")
+            return None, 0.0
+        vector /= np.linalg.norm(vector) or 1
+        scores = prototypes @ vector / self.temperature
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(np.argmax(probabilities))
+        return self.categories[best], float(probabilities[best])
@@ -1,97 +1,206 @@
-import requests
 import json
+import re
 import time
+from cache import LRUCache
+from commands import CommandCompiler
+from metrics import CASCADE_ANSWERS, timed
+from stream import JSONFieldParser
+from structured import coerce, repair_json, token_budget, validate
+from ollama_client import OllamaError
+from scheduler import PRIORITY_HIGH
 
-class IOT:
-    def __init__(
-        self,
-        model,
-        ollama_host
-    ):
-        self.model = model,
-        self.ollama_host = ollama_host
-        self.session = requests.Session()
-        self.session.headers.update({"Connection": "keep-alive"})
-
-    def create_interactive_prompt(self, temp, hum, button_state, ledRed, ledBlue, ledGreen, ldrValue, servoAngle, user_input):
-        return f"""
-You are an IoT SLM controller. Always respond ONLY with valid JSON.
-SYSTEM STATUS:
-- temperature: {temp:.1f}
-- humidity: {hum:.1f}
-- button_pressed: {str(button_state).lower()}
-- leds: red={str(ledRed).lower()}, blue={str(ledBlue).lower()}, green={str(ledGreen).lower()}
-- ldr_value: {ldrValue}
-- servo_angle: {servoAngle}
+# Static instructions go first and never change, so Ollama can reuse their
+# evaluated prefix between calls. Live sensor values come after them.
+IOT_SYSTEM_PROMPT = """You are an IoT SLM controller. Always respond ONLY with valid JSON.
 RULES:
 1. Output ONLY this JSON structure:
-{{ 
-"message": "",
-"leds": {{ 
+{ 
+"leds": { 
     "red_led": bool,
     "green_led": bool,
     "blue_led": bool
-}},
+},
 "servo_angle": int,
-"pomodoro": {{ 
+"pomodoro": { 
     "start": bool,
     "stop": bool,
     "minutes": int
-}}
-}}
+},
+"message": ""
+}
 2. Do NOT add any text outside the JSON.
 3. If the user asks for information, keep all hardware states unchanged.
 4. If the user requests an action, update the states.
 5. Only ONE LED may be ON unless the user explicitly requests multiple.
 6. If the user asks about the environment, evaluate study productivity based on SYSTEM STATUS.
 7. Keep "message" short and clear.
+8. "servo_angle" goes from 0 to 180 degrees.
+"""
 
-USER INPUT: "{user_input}"
+# Passed as Ollama's "format" so decoding can only produce this structure.
+# Properties are listed in the order the model writes them: actuators first.
+IOT_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "leds": {
+            "type": "object",
+            "properties": {
+                "red_led": {"type": "boolean"},
+                "green_led": {"type": "boolean"},
+                "blue_led": {"type": "boolean"}
+            },
+            "required": ["red_led", "green_led", "blue_led"]
+        },
+        "servo_angle": {"type": "integer", "minimum": 0, "maximum": 180},
+        "pomodoro": {
+            "type": "object",
+            "properties": {
+                "start": {"type": "boolean"},
+                "stop": {"type": "boolean"},
+                "minutes": {"type": "integer", "minimum": 0, "maximum": 120}
+            },
+            "required": ["start", "stop", "minutes"]
+        },
+        "message": {"type": "string", "maxLength": 200}
+    },
+    "required": ["leds", "servo_angle", "pomodoro", "message"]
+}
 
+class IOT:
+    def __init__(
+        self,
+        model,
+        client,
+        cache_size=256,
+        cache_ttl=300,
+        temperature_resolution=0.5,
+        humidity_resolution=0.5,
+        ldr_bin_size=256,
+        cascade=None
+    ):
+        self.model = model
+        # Smaller models tried first, in order; `model` only answers when their output fails validation
+        self.cascade = list(cascade or [])
+        self.client = client
+        # Responses keyed on the normalized input plus the quantized sensor state
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self.temperature_resolution = temperature_resolution
+        self.humidity_resolution = humidity_resolution
+        self.ldr_bin_size = ldr_bin_size
+        # Deterministic fast path for the common commands
+        self.compiler = CommandCompiler()
+        # Enough tokens for the longest valid response, nothing more
+        self.num_predict = token_budget(IOT_RESPONSE_SCHEMA)
+
+    def create_interactive_prompt(self, temp, hum, button_state, ledRed, ledBlue, ledGreen, ldrValue, servoAngle, user_input, trends=None):
+        """Variable part of the prompt, sent after the static IOT_SYSTEM_PROMPT"""
+        # Recent sensor trends from the device state store, when the board has history
+        trend_line = ""
+        if trends:
+            trend_line = "- trends: " + ", ".join(f"{field} {trend}" for field, trend in trends.items()) + "\n"
+        return f"""SYSTEM STATUS:
+- temperature: {temp:.1f}
+- humidity: {hum:.1f}
+- button_pressed: {str(button_state).lower()}
+- leds: red={str(ledRed).lower()}, blue={str(ledBlue).lower()}, green={str(ledGreen).lower()}
+- ldr_value: {ldrValue}
+- servo_angle: {servoAngle}
+{trend_line}
+USER INPUT: "{user_input}"
 """
 
-    def slm_inference(self, PROMPT):
-        response = self.session.post(
-            url=f"{self.ollama_host}/api/generate",
-            json={
-                "model": "gemma3",
+    def slm_inference(self, PROMPT, model=None):
+        try:
+            response = self.client.generate(
+                {
+                    "model": model or self.model,
+                    "system": IOT_SYSTEM_PROMPT,
+                    "prompt": PROMPT,
+                    "format": IOT_RESPONSE_SCHEMA,
+                    "options": {"num_predict": self.num_predict},
+                },
+                priority=PRIORITY_HIGH
+            )
+        except OllamaError as e:
+            print(str(e))
+            return ""
+        print(response.get("response", {}))
+        return response.get("response", {})
+
+    def slm_inference_stream(self, PROMPT):
+        """Yield the response tokens as Ollama produces them"""
+        try:
+            yield from self.client.generate_stream({
+                "model": self.model,
+                "system": IOT_SYSTEM_PROMPT,
                 "prompt": PROMPT,
-                "stream": False,
-                "format":"json",
-            }
+                "format": IOT_RESPONSE_SCHEMA,
+                "options": {"num_predict": self.num_predict},
+            }, priority=PRIORITY_HIGH)
+        except OllamaError as e:
+            print(str(e))
+
+    def current_state(self, body):
+        """Device state in the response format, used for anything the model left out"""
+        if body is None:
+            return {}
+        return {
+            "leds": {"red_led": body["led_red"], "green_led": body["led_green"], "blue_led": body["led_blue"]},
+            "servo_angle": body["servo_angle"],
+        }
+
+    def parse_interactive_response(self, response_text, body=None):
+        """
+        Parse the interactive SLM JSON response.
+        Truncated output is repaired and values are clamped to IOT_RESPONSE_SCHEMA,
+        missing fields keep the current device state.
+        """
+        with timed("json_parse", self.model):
+            state = self.current_state(body)
+            decoded = repair_json(response_text)
+            if decoded is None:
+                print(f"Error parsing JSON response: {response_text!r}")
+            response = coerce(decoded, IOT_RESPONSE_SCHEMA, state)
+        message = response["message"] if decoded is not None else "Error"
+        leds = response["leds"]
+        pomodoro = response["pomodoro"]
+        return (
+            message,
+            (leds["red_led"], leds["blue_led"], leds["green_led"]),
+            response["servo_angle"],
+            (pomodoro["start"], pomodoro["stop"], pomodoro["minutes"])
         )
-        print(response.json().get("response", {}))
-        return response.json().get("response", {})
-
-    def parse_interactive_response(self, response_text):
-        """Parse the interactive SLM JSON response."""
-        try: 
-            response_text = json.loads(response_text)     
-            # response_text = json.loads(response_text)
-            message = response_text.get("message", "")
-            # Extract LED states
-            leds = response_text.get('leds', {})
-            red_led = leds.get('red_led', False)
-            blue_led = leds.get('blue_led', False)
-            green_led = leds.get('green_led', False)
-            # Extract Pomoodoro info
-            pomodoro = response_text.get('pomodoro', {})
-            pomodoro_start = pomodoro.get('start', False)
-            pomodoro_stop = pomodoro.get('stop', False)
-            pomodoro_minutes = pomodoro.get('minutes', 0)
-            # Extract Servo angle
-            servo_angle = response_text.get('servo_angle', 0)
-            return message, (red_led, blue_led, green_led), servo_angle, (pomodoro_start, pomodoro_stop, pomodoro_minutes)
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"Error parsing JSON response: {e}")
-            print(f"Response was: {response_text}")
-            return "Error", (False, False, False), 0, (False, False, 0, 0)
-    
-    def query(self, body):
-        # Create prompt with user input
-        print("Sending requesto to IoT SLM...")
-        start_time = time.time()
-        system_prompt = self.create_interactive_prompt(
+
+    def validate_response(self, response_text):
+        """Problems with a raw model answer, empty when it can be used without repair"""
+        try:
+            response = json.loads(response_text)
+        except (TypeError, ValueError):
+            return ["response is not valid JSON"]
+        problems = validate(response, IOT_RESPONSE_SCHEMA)
+        if not problems and not response["message"].strip():
+            problems.append("$.message is empty")
+        return problems
+
+    def cascade_inference(self, prompt):
+        """
+        Try the cascade models in order, returns the first raw answer that
+        passes validate_response(), or None when all of them fail.
+        """
+        for model in self.cascade:
+            start_time = time.time()
+            response = self.slm_inference(prompt, model)
+            problems = self.validate_response(response)
+            if not problems:
+                CASCADE_ANSWERS.inc(task="iot", model=model, outcome="accepted")
+                print(f"Answered by {model} in {time.time() - start_time:.2f} seconds")
+                return response
+            CASCADE_ANSWERS.inc(task="iot", model=model, outcome="escalated")
+            print(f"{model} answer failed validation ({problems[0]}), escalating")
+        return None
+
+    def build_prompt(self, body):
+        return self.create_interactive_prompt(
             body["temperature"],
             body["humidity"],
             body["btn_pressed"],
@@ -100,13 +209,115 @@ USER INPUT: "{user_input}"
             body["led_green"],
             body["ldr_value"],
             body["servo_angle"],
-            body["user_input"]
+            body["user_input"],
+            body.get("trends")
+        )
+
+    def cache_key(self, body):
+        """Normalized user input plus the prompt's sensor fields, bucketed to the configured resolution"""
+        user_input = re.sub(r"\s+", " ", body["user_input"].lower()).strip(" .!?")
+        return (
+            user_input,
+            round(body["temperature"] / self.temperature_resolution),
+            round(body["humidity"] / self.humidity_resolution),
+            bool(body["btn_pressed"]),
+            bool(body["led_red"]),
+            bool(body["led_blue"]),
+            bool(body["led_green"]),
+            int(body["ldr_value"]) // self.ldr_bin_size,
+            int(body["servo_angle"]),
+            tuple(sorted((body.get("trends") or {}).items())),
         )
-        # Get SLM response
-        response = self.slm_inference(system_prompt)
+
+    def cached_response(self, key):
+        cached = self.cache.get(key)
+        stats = self.cache.stats()
+        print(f"IoT cache {'hit' if cached else 'miss'} (hits={stats['hits']}, misses={stats['misses']})")
+        return cached
+
+    def compile_command(self, body):
+        compiled = self.compiler.compile(body)
+        if compiled:
+            print(f"Command compiled without SLM: {compiled[-1]}")
+        return compiled
+
+    def query(self, body):
+        compiled = self.compile_command(body)
+        if compiled:
+            return compiled
+
+        key = self.cache_key(body)
+        cached = self.cached_response(key)
+        if cached:
+            parsed, response = cached
+            return (*parsed, response)
+
+        # Create prompt with user input
+        print("Sending requesto to IoT SLM...")
+        start_time = time.time()
+        system_prompt = self.build_prompt(body)
+        # Get SLM response, from a cascade model when one gives a valid answer
+        response = self.cascade_inference(system_prompt)
+        if response is None:
+            response = self.slm_inference(system_prompt)
         #Parse response
-        message,(red, blue, green), servo_angle, (pomodoro_start, pomodoro_stop, pomodoro_minutes) = self.parse_interactive_response(response)
+        message,(red, blue, green), servo_angle, (pomodoro_start, pomodoro_stop, pomodoro_minutes) = self.parse_interactive_response(response, body)
+        if message != "Error":
+            self.cache.put(key, ((message, (red, blue, green), servo_angle, (pomodoro_start, pomodoro_stop, pomodoro_minutes)), response))
         end_time = time.time()
         latency = end_time - start_time
         print(f"Response latency: {latency:.2f} seconds using model: {self.model}")
-        return message,(red, blue, green), servo_angle, (pomodoro_start, pomodoro_stop, pomodoro_minutes), response
\ No newline at end of file
+        return message,(red, blue, green), servo_angle, (pomodoro_start, pomodoro_stop, pomodoro_minutes), response
+
+    def replay_stream(self, parsed, response):
+        """Stream events for a response that is already complete"""
+        for field, value in (repair_json(response) or {}).items():
+            yield "field", field, value
+        yield "result", parsed, response
+
+    def query_stream(self, body):
+        """
+        Streaming version of query().
+        Yields ("field", key, value) for every top-level JSON field as soon as it
+        is complete (leds, servo_angle and pomodoro come before message), then
+        ("result", parsed_response, raw_response) once the generation ends.
+        """
+        compiled = self.compile_command(body)
+        if compiled:
+            *parsed, response = compiled
+            yield from self.replay_stream(tuple(parsed), response)
+            return
+
+        key = self.cache_key(body)
+        cached = self.cached_response(key)
+        if cached:
+            yield from self.replay_stream(*cached)
+            return
+
+        # Cascade models answer whole: their output is validated before anything is sent
+        response = self.cascade_inference(self.build_prompt(body))
+        if response is not None:
+            parsed = self.parse_interactive_response(response, body)
+            self.cache.put(key, (parsed, response))
+            yield from self.replay_stream(parsed, response)
+            return
+
+        print("Streaming request to IoT SLM...")
+        start_time = time.time()
+        parser = JSONFieldParser()
+        state = self.current_state(body)
+        fields = IOT_RESPONSE_SCHEMA["properties"]
+        response = ""
+        for token in self.slm_inference_stream(self.build_prompt(body)):
+            response += token
+            for field, value in parser.feed(token):
+                if field not in fields:
+                    continue
+                print(f"Field ready after {time.time() - start_time:.2f} seconds: {field}")
+                yield "field", field, coerce(value, fields[field], state.get(field))
+        latency = time.time() - start_time
+        print(f"Response latency: {latency:.2f} seconds using model: {self.model}")
+        parsed = self.parse_interactive_response(response, body)
+        if parsed[0] != "Error":
+            self.cache.put(key, (parsed, response))
+        yield "result", parsed, response
\ No newline at end of file
@@ -0,0 +1,182 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a cache hit to a long RAG answer on CPU
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+# Route of the request handled by the current thread, set by the Flask hooks
+context = threading.local()
+
+
+def current_route():
+    return getattr(context, "route", "none")
+
+
+def set_route(route):
+    context.route = route
+
+
+class Histogram:
+    """
+    Prometheus-style cumulative histogram with labels.
+    observe() is a bisect plus a few additions under a lock, cheap enough for
+    every request.
+    """
+
+    def __init__(self, name, description, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {key: dict(value, counts=list(value["counts"])) for key, value in self.series.items()}
+        for key, value in sorted(series.items()):
+            labels = ",".join(f'{label}="{escape(v)}"' for label, v in zip(self.labels, key))
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, value["counts"]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {value["count"]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {value['sum']}")
+            lines.append(f"{self.name}_count{{{labels}}} {value['count']}")
+        return lines
+
+
+class Counter:
+    """Labelled monotonic counter"""
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            series = dict(self.series)
+        for key, value in sorted(series.items()):
+            labels = ",".join(f'{label}="{escape(v)}"' for label, v in zip(self.labels, key))
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+class CacheCollector:
+    """Hits, misses and size of the registered caches, read from their stats() at scrape time"""
+
+    def __init__(self):
+        self.caches = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, cache):
+        with self.lock:
+            self.caches[name] = cache
+
+    def stats(self):
+        with self.lock:
+            caches = dict(self.caches)
+        return {name: cache.stats() for name, cache in caches.items()}
+
+    def render(self):
+        stats = sorted(self.stats().items())
+        lines = []
+        for field, kind, name, description in (
+            ("hits", "counter", "slm_cache_hits_total", "Cache lookups answered from the cache"),
+            ("misses", "counter", "slm_cache_misses_total", "Cache lookups that missed"),
+            ("size", "gauge", "slm_cache_entries", "Entries currently held by the cache"),
+        ):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            lines += [f'{name}{{cache="{escape(cache)}"}} {values[field]}' for cache, values in stats]
+        return lines
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Flask request duration until the response is returned",
+    ("route", "method", "status")
+)
+STAGE_SECONDS = Histogram(
+    "slm_stage_duration_seconds",
+    "Duration of each pipeline stage (classification, retrieval, embedding, queue, prompt_eval, generation, json_parse)",
+    ("stage", "route", "model")
+)
+OLLAMA_TOKENS = Histogram(
+    "ollama_tokens",
+    "Tokens per Ollama call, prompt (prompt_eval_count) and generated (eval_count)",
+    ("kind", "route", "model"),
+    buckets=TOKEN_BUCKETS
+)
+CASCADE_ANSWERS = Counter(
+    "slm_cascade_answers_total",
+    "Answers per cascade model: accepted, or escalated to the next model after failing validation",
+    ("task", "model", "outcome")
+)
+CACHES = CacheCollector()
+METRICS = (HTTP_SECONDS, STAGE_SECONDS, OLLAMA_TOKENS, CASCADE_ANSWERS, CACHES)
+
+
+def observe_stage(stage, seconds, model=""):
+    STAGE_SECONDS.observe(seconds, stage=stage, route=current_route(), model=model)
+
+
+@contextmanager
+def timed(stage, model=""):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, model)
+
+
+def observe_ollama(body):
+    """Record the timings Ollama returns with a finished generation (durations are in ns)"""
+    model = body.get("model", "")
+    route = current_route()
+    if body.get("load_duration"):
+        observe_stage("load", body["load_duration"] / 1e9, model)
+    if "prompt_eval_duration" in body:
+        observe_stage("prompt_eval", body["prompt_eval_duration"] / 1e9, model)
+    if "eval_duration" in body:
+        observe_stage("generation", body["eval_duration"] / 1e9, model)
+    if "prompt_eval_count" in body:
+        OLLAMA_TOKENS.observe(body["prompt_eval_count"], kind="prompt", route=route, model=model)
+    if "eval_count" in body:
+        OLLAMA_TOKENS.observe(body["eval_count"], kind="generated", route=route, model=model)
+
+
+def render():
+    """Text exposition format served by /metrics"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,93 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import paho.mqtt.client as mqtt
+from metrics import set_route
+
+
+class MqttBridge:
+    """
+    Long-lived channel to the boards through a local MQTT broker.
+    Boards publish to "<prefix>/<device_id>/<kind>" and the matching handler
+    runs as handler(device_id, body), yielding (subtopic, payload) messages
+    published back to "<prefix>/<device_id>/<subtopic>". Kinds listed in
+    `background` (slow model calls) run on a thread pool, the others inline
+    in the network thread so a board's telemetry is applied in order.
+    """
+
+    def __init__(self, host, handlers, port=1883, prefix="slm", background=(), workers=4, qos=1, keepalive=60, client_id="slm-backend", username=None, password=None):
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.handlers = handlers
+        self.background = set(background)
+        self.qos = qos
+        self.keepalive = keepalive
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mqtt")
+        self.devices = set()
+        self.stats = {"received": 0, "published": 0}
+        self.lock = threading.Lock()
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+    def start(self):
+        """Connect in the background, paho reconnects on its own when the broker goes away"""
+        self.client.connect_async(self.host, self.port, self.keepalive)
+        self.client.loop_start()
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"[MQTT] Connection to {self.host}:{self.port} refused: {reason_code}")
+            return
+        print(f"[MQTT] Connected to {self.host}:{self.port}")
+        # Subscriptions do not survive a reconnect with a clean session
+        for kind in self.handlers:
+            client.subscribe(f"{self.prefix}/+/{kind}", qos=self.qos)
+
+    def on_message(self, client, userdata, message):
+        parts = message.topic.split("/")
+        if len(parts) != 3 or parts[2] not in self.handlers:
+            return
+        _, device_id, kind = parts
+        try:
+            body = json.loads(message.payload)
+        except ValueError:
+            print(f"[MQTT] Invalid JSON on {message.topic}")
+            return
+        with self.lock:
+            self.stats["received"] += 1
+            self.devices.add(device_id)
+        if kind in self.background:
+            self.executor.submit(self.handle, kind, device_id, body)
+        else:
+            self.handle(kind, device_id, body)
+
+    def handle(self, kind, device_id, body):
+        set_route(f"mqtt/{kind}")
+        try:
+            for subtopic, payload in self.handlers[kind](device_id, body):
+                self.publish(device_id, subtopic, payload)
+        except Exception as e:
+            print(f"[MQTT] Error handling {kind} from {device_id}: {e}")
+            self.publish(device_id, "response", {"error": str(e), "done": True})
+
+    def publish(self, device_id, subtopic, payload):
+        if not isinstance(payload, str):
+            payload = json.dumps(payload)
+        self.client.publish(f"{self.prefix}/{device_id}/{subtopic}", payload.strip(), qos=self.qos)
+        with self.lock:
+            self.stats["published"] += 1
+
+    def knows(self, device_id):
+        """True once the board has talked to us over MQTT"""
+        with self.lock:
+            return device_id in self.devices
+
+    def status(self):
+        with self.lock:
+            return {"connected": self.client.is_connected(), "devices": len(self.devices), **self.stats}
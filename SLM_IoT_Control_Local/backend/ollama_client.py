@@ -0,0 +1,101 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import observe_ollama, timed
+from stream import iter_ollama_tokens
+
+
+class OllamaError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        # HTTP status from Ollama, None for connection errors and timeouts
+        self.status = status
+
+
+class OllamaClient:
+    """
+    Connection-pooled HTTP client shared by IOT, RAG and AGENT.
+    Generation calls hold one of `max_generations` slots, so a burst of
+    requests queues here instead of piling onto the single Ollama instance.
+    """
+
+    def __init__(
+        self,
+        host,
+        pool_size=16,
+        max_generations=2,
+        connect_timeout=5,
+        generate_timeout=120,
+        embed_timeout=30,
+        keep_alive=None
+    ):
+        self.host = host.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.generate_timeout = generate_timeout
+        self.embed_timeout = embed_timeout
+        self.generation_slots = threading.BoundedSemaphore(max_generations)
+        # Per-model keep_alive, "*" applies to every other model, e.g. {"gemma3": "1h", "*": "30m"}
+        self.keep_alive = keep_alive or {}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Connection": "keep-alive"})
+
+    def post(self, path, payload, timeout, stream=False):
+        try:
+            response = self.session.post(
+                f"{self.host}{path}",
+                json=payload,
+                timeout=(self.connect_timeout, timeout),
+                stream=stream
+            )
+        except requests.RequestException as e:
+            raise OllamaError(f"Error connecting to Ollama: {e}") from e
+        if response.status_code != 200:
+            response.close()
+            raise OllamaError(f"Error: Received status code {response.status_code} from Ollama API", response.status_code)
+        return response
+
+    def ping(self, timeout=2):
+        """True when the Ollama API answers, used by the readiness probe"""
+        try:
+            return self.session.get(f"{self.host}/api/tags", timeout=(self.connect_timeout, timeout)).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def with_keep_alive(self, payload):
+        """Keep the model (and its cached prompt prefix) loaded between calls"""
+        keep_alive = self.keep_alive.get(payload.get("model"), self.keep_alive.get("*"))
+        if keep_alive is None or "keep_alive" in payload:
+            return payload
+        return dict(payload, keep_alive=keep_alive)
+
+    def generate(self, payload, timeout=None):
+        """Non-streaming /api/generate call, returns the decoded JSON body"""
+        with self.generation_slots:
+            response = self.post("/api/generate", dict(self.with_keep_alive(payload), stream=False), timeout or self.generate_timeout)
+            body = response.json()
+        observe_ollama(body)
+        return body
+
+    def generate_stream(self, payload, timeout=None):
+        """Streaming /api/generate call, yields the response tokens"""
+        with self.generation_slots:
+            with self.post("/api/generate", dict(self.with_keep_alive(payload), stream=True), timeout or self.generate_timeout, stream=True) as response:
+                yield from iter_ollama_tokens(response, observe_ollama)
+
+    def embed(self, model, text, timeout=None):
+        """Single-text embedding, returns the embedding vector"""
+        return self.embed_batch(model, [text], timeout)[0]
+
+    def embed_batch(self, model, texts, timeout=None):
+        """
+        Batch /api/embed call, returns one vector per input text.
+        Queries and documents both go through this endpoint so their vectors
+        are normalized the same way.
+        """
+        with timed("embedding", model):
+            response = self.post("/api/embed", self.with_keep_alive({"model": model, "input": texts}), timeout or self.embed_timeout)
+            return response.json()["embeddings"]
@@ -0,0 +1,167 @@
+import itertools
+import threading
+import time
+from ollama_client import OllamaError
+
+
+class Endpoint:
+    """One Ollama instance in the pool, `models` limits which models it serves (None = all)"""
+
+    def __init__(self, client, models=None):
+        self.client = client
+        self.models = set(models) if models else None
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+
+    @property
+    def host(self):
+        return self.client.host
+
+    def pinned(self, model):
+        return self.models is not None and (model in self.models or model.split(":")[0] in self.models)
+
+    def serves(self, model):
+        return self.models is None or self.pinned(model)
+
+
+class OllamaPool:
+    """
+    Several Ollama instances behind the OllamaClient interface, so IOT, RAG,
+    AGENT and the scheduler use it unchanged.
+    - each request goes to the healthy host serving its model with the fewest
+      outstanding requests (ties rotate); hosts configured for a model are
+      preferred over hosts that serve everything
+    - connection errors, timeouts and 5xx responses mark the host unhealthy and
+      the request is retried on the next host; a stream is only retried before
+      its first token
+    - a background health check pings every host each `health_interval` seconds
+    """
+
+    def __init__(self, endpoints, health_interval=10):
+        self.endpoints = endpoints
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        self.rotation = itertools.count()
+
+        if health_interval and len(endpoints) > 1:
+            threading.Thread(target=self.health_loop, name="ollama-health", daemon=True).start()
+
+    @property
+    def host(self):
+        return ",".join(endpoint.host for endpoint in self.endpoints)
+
+    def serving(self, models):
+        """Endpoints that serve at least one of `models`"""
+        return [e for e in self.endpoints if any(e.serves(model) for model in models)]
+
+    def acquire(self, model, tried):
+        with self.lock:
+            candidates = [e for e in self.endpoints if e.serves(model) and e not in tried]
+            # Unhealthy hosts are still tried when nothing else is left
+            candidates = [e for e in candidates if e.healthy] or candidates
+            # Hosts dedicated to the model take it before general-purpose ones
+            candidates = [e for e in candidates if e.pinned(model)] or candidates
+            if not candidates:
+                return None
+            offset = next(self.rotation)
+            endpoint = min(
+                candidates,
+                key=lambda e: (e.outstanding, (candidates.index(e) - offset) % len(candidates))
+            )
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint, ok):
+        with self.lock:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.failures = 0
+                endpoint.healthy = True
+            else:
+                endpoint.failures += 1
+                endpoint.healthy = False
+
+    def retryable(self, error):
+        return error.status is None or error.status >= 500
+
+    def call(self, model, request):
+        """request(client) on the best host, failing over to the others"""
+        tried = []
+        error = None
+        while True:
+            endpoint = self.acquire(model, tried)
+            if endpoint is None:
+                raise error or OllamaError(f"Error: No Ollama host serves model {model}")
+            tried.append(endpoint)
+            try:
+                result = request(endpoint.client)
+            except OllamaError as e:
+                failed = self.retryable(e)
+                self.release(endpoint, not failed)
+                if not failed:
+                    raise
+                print(f"Ollama host {endpoint.host} failed, trying another: {e}")
+                error = e
+                continue
+            self.release(endpoint, True)
+            return result
+
+    def ping(self, timeout=2):
+        return any(endpoint.client.ping(timeout) for endpoint in self.endpoints)
+
+    def generate(self, payload, timeout=None):
+        return self.call(payload.get("model"), lambda client: client.generate(payload, timeout))
+
+    def generate_stream(self, payload, timeout=None):
+        tried = []
+        error = None
+        while True:
+            endpoint = self.acquire(payload.get("model"), tried)
+            if endpoint is None:
+                raise error or OllamaError(f"Error: No Ollama host serves model {payload.get('model')}")
+            tried.append(endpoint)
+            started = False
+            ok = True
+            try:
+                for token in endpoint.client.generate_stream(payload, timeout):
+                    started = True
+                    yield token
+                return
+            except OllamaError as e:
+                ok = not self.retryable(e)
+                if ok or started:
+                    raise
+                print(f"Ollama host {endpoint.host} failed, trying another: {e}")
+                error = e
+            finally:
+                self.release(endpoint, ok)
+
+    def embed(self, model, text, timeout=None):
+        return self.call(model, lambda client: client.embed(model, text, timeout))
+
+    def embed_batch(self, model, texts, timeout=None):
+        return self.call(model, lambda client: client.embed_batch(model, texts, timeout))
+
+    def health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            for endpoint in self.endpoints:
+                healthy = endpoint.client.ping()
+                with self.lock:
+                    if healthy != endpoint.healthy:
+                        print(f"Ollama host {endpoint.host} is {'back' if healthy else 'unreachable'}")
+                    endpoint.healthy = healthy
+
+    def status(self):
+        with self.lock:
+            return [
+                {
+                    "host": endpoint.host,
+                    "healthy": endpoint.healthy,
+                    "outstanding": endpoint.outstanding,
+                    "models": sorted(endpoint.models) if endpoint.models else "all",
+                    "failures": endpoint.failures
+                }
+                for endpoint in self.endpoints
+            ]
@@ -12,16 +12,30 @@ pip install tiktoken
 '''
 
 import os
+import re
+import json
 import time
+import shutil
+import hashlib
+import threading
 import requests
 import concurrent.futures
-from functools import lru_cache
+from bs4 import BeautifulSoup
+from ollama_client import OllamaError
+from embedding_store import EmbeddingStore
+from ingest import IngestPipeline
+from vector_index import NumpyIndex, NumpyRetriever
+from retrieval import BM25Index, HybridRetriever, chunk_key
+from cache import LRUCache, SemanticCache
+from metrics import timed
+from scheduler import PRIORITY_LOW
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import WebBaseLoader, PyPDFLoader
+from langchain_community.document_loaders import PyPDFLoader
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
 # from langchain_community.vectorstores import Chroma
-from langchain_ollama import ChatOllama, OllamaEmbeddings
+from langchain_ollama import ChatOllama
 
 
 # from langsmith import Client  # updated SDK
@@ -38,6 +52,18 @@ from langchain_ollama import ChatOllama, OllamaEmbeddings
 # ollama pull all-minilm;
 # ollama pull gemma3;
 
+# Static instructions go first so Ollama can reuse their evaluated prefix,
+# the retrieved context and the question follow in the prompt
+RAG_SYSTEM_PROMPT = (
+    "You are an AI assistant specialized in Franzininho documentation. "
+    "Answer the following question based only on the information provided in the context below. "
+    "Be concise and direct. If the context doesn't contain relevant information, admit that you don't know."
+)
+
+# Answer for documentation questions that arrive before the background startup finished
+RAG_NOT_READY_MESSAGE = "The documentation is still loading, please try again in a few seconds."
+RAG_NO_CONTEXT_MESSAGE = "I don't have enough information to answer this question accurately."
+
 class RAG:
     def __init__(
         self, 
@@ -46,10 +72,24 @@ class RAG:
         urls, 
         pdfs,
         text,   
+        client,
         embed_model="nomic-embed-text",
+        embedding_cache_path="embedding_cache.db",
         collection_name="rag_collection",
         chunk_size=300,
-        chunk_overlap=30
+        chunk_overlap=30,
+        ingest_workers=4,
+        embed_workers=2,
+        retriever_backend="chroma",
+        top_k=2,
+        ivf_clusters=0,
+        hybrid=False,
+        answer_cache_size=128,
+        answer_cache_ttl=3600,
+        semantic_threshold=0.95,
+        ready_timeout=10,
+        retry_delay=5,
+        max_retry_delay=60
     ):
         self.persist_dir = persist_dir
         self.model = model
@@ -57,58 +97,180 @@ class RAG:
         self.pdfs = pdfs
         self.text = text
         self.embed_model = embed_model
+        self.client = client
         self.collection_name = collection_name
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.ingest_workers = ingest_workers
+        self.embed_workers = embed_workers
+        # "chroma" (LangChain retriever) or "numpy" (in-process NumpyIndex)
+        self.retriever_backend = retriever_backend
+        self.top_k = top_k
+        self.ivf_clusters = ivf_clusters
+        self.index_dir = os.path.join(persist_dir, "numpy_index")
+        # BM25 + vector retrieval with reranking
+        self.hybrid = hybrid
+        self.bm25_path = os.path.join(persist_dir, "bm25.json")
+        self.vector_retriever = None
+        # Answers keyed on (normalized question, retrieved chunk ids), plus a
+        # near-duplicate lookup by query embedding. Both are cleared whenever
+        # ingestion changes the chunk set.
+        self.answer_cache = LRUCache(maxsize=answer_cache_size, ttl=answer_cache_ttl)
+        self.semantic_cache = SemanticCache(maxsize=answer_cache_size, ttl=answer_cache_ttl, threshold=semantic_threshold) if semantic_threshold else None
         self.vectorstore = None
         self.retriever = None
+        self.ingest_lock = threading.Lock()
+        # Shared by ingestion and queries, backed by the persistent embedding store
+        self.embeddings = self.OptimizedOllamaEmbeddings(
+            self.embed_model,
+            self.client,
+            EmbeddingStore(embedding_cache_path),
+            workers=embed_workers
+        )
+        self.generation_options = {
+            "num_predict": 512,
+            "temperature": 0,
+            "top_k": 40,
+            "top_p": 0.9,
+            "seed": 42  # Fixed seed for consistent outputs
+        }
 
         # self.llm = ChatOllama(model=self.model, temperature=0)
 
-        self.preload_models()
-        self.create_vectorstore(self.urls, self.pdfs, self.text, recreate=False)
-        self.load_vectorstore()
+        # Set by start(): index "stopped" -> "loading" -> "ready" | "failed",
+        # models "stopped" -> "warming" -> "ready" | "failed"
+        self.state = "stopped"
+        self.models_state = "stopped"
+        self.error = None
+        self.ready = threading.Event()
+        # How long a query waits for the index before answering RAG_NOT_READY_MESSAGE
+        self.ready_timeout = ready_timeout
+        # A failed startup is retried with exponential backoff
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.attempts = 0
+        self.init_lock = threading.Lock()
+
+    # --------------------------------------------------------
+    # Background startup
+    # --------------------------------------------------------
+    def start(self):
+        """Warm the models and build/load the index in background threads, queries wait on self.ready"""
+        self.state = "loading"
+        self.models_state = "warming"
+        threading.Thread(target=self.warm_models, name="rag-warmup", daemon=True).start()
+        threading.Thread(target=self.initialize, name="rag-init", daemon=True).start()
+
+    def warm_models(self):
+        self.models_state = "ready" if self.preload_models() else "failed"
+
+    def initialize(self):
+        """Build/load the index until it works, e.g. while Ollama is still pulling the models on first boot"""
+        delay = self.retry_delay
+        while not self.try_initialize():
+            print(f"[INFO] Retrying RAG initialization in {delay} seconds...")
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    def try_initialize(self):
+        with self.init_lock:
+            if self.ready.is_set():
+                return True
+            self.state = "loading"
+            self.attempts += 1
+            try:
+                self.create_vectorstore(self.urls, self.pdfs, self.text, recreate=False)
+                self.load_vectorstore()
+            except Exception as e:
+                print(f"Error initializing RAG: {e}")
+                self.error = str(e)
+                self.state = "failed"
+                return False
+            self.error = None
+            self.state = "ready"
+            self.ready.set()
+            print("[INFO] RAG ready.")
+            return True
+
+    def wait_ready(self):
+        """True once the retriever is usable, waits up to ready_timeout while startup is running"""
+        if self.ready.is_set():
+            return True
+        if self.state != "loading":
+            return False
+        print(f"RAG still loading, waiting up to {self.ready_timeout} seconds...")
+        return self.ready.wait(self.ready_timeout)
+
+    def status(self):
+        return {"state": self.state, "models": self.models_state, "error": self.error, "attempts": self.attempts}
 
     # --------------------------------------------------------
     # Custom embedding class that uses Ollama directly and implements caching
     # --------------------------------------------------------
     class OptimizedOllamaEmbeddings:
-        def __init__(self, embed_model):
+        def __init__(self, embed_model, client, store=None, batch_size=64, workers=2):
             self.embed_model = embed_model
+            self.client = client
+            self.store = store
+            self.batch_size = batch_size
+            # Long-lived pool for concurrent /api/embed batches
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed")
+            # Concurrent embed_query calls for the same text (intent classifier and
+            # speculative retrieval) share one request
+            self.inflight = {}
+            self.inflight_lock = threading.Lock()
 
         # Direct Ollama API functions for better performance
         def direct_ollama_embed(self, text):
             """Get embeddings directly from Ollama API"""
-            response = requests.post(
-                "http://ollama:11434/api/embeddings",
-                json={"model": self.embed_model, "prompt": text}
-            )
-            if response.status_code == 200:
-                return response.json()["embedding"]
-            else:
-                raise Exception(f"Error from Ollama API: {response.status_code}")
-
-        # Cache embeddings to avoid recalculating
-        @lru_cache(maxsize=100)
-        def cached_embed_query(self, text):
-            """Cache embeddings for repeated queries"""
-            return self.direct_ollama_embed(text)
+            return self.client.embed(self.embed_model, text)
 
         def embed_query(self, text):
-            """Get embeddings for a query with caching"""
-            return self.cached_embed_query(text)
+            """Get embeddings for a query, reusing the persistent store"""
+            if self.store is not None:
+                vector = self.store.get(self.embed_model, text)
+                if vector is not None:
+                    return vector
+
+            with self.inflight_lock:
+                future = self.inflight.get(text)
+                owner = future is None
+                if owner:
+                    future = self.inflight[text] = concurrent.futures.Future()
+            if not owner:
+                return future.result()
+
+            try:
+                vector = self.direct_ollama_embed(text)
+                if self.store is not None:
+                    self.store.put(self.embed_model, text, vector)
+                future.set_result(vector)
+                return vector
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self.inflight_lock:
+                    del self.inflight[text]
         
         def embed_documents(self, documents):
-            """Get embeddings for documents - not cached as this is mainly used during DB creation"""
-            results = []
-            # Process in batches of 4 for efficiency
-            batch_size = 4
-            for i in range(0, len(documents), batch_size):
-                batch = documents[i:i+batch_size]
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    batch_results = list(executor.map(self.direct_ollama_embed, batch))
-                results.extend(batch_results)
-            return results
+            """Get embeddings for documents, only texts missing from the store are sent to Ollama"""
+            cached = self.store.get_many(self.embed_model, documents) if self.store is not None else {}
+            missing = list(dict.fromkeys(text for text in documents if text not in cached))
+            if cached:
+                print(f"[INFO] {len(documents) - len(missing)} of {len(documents)} embeddings reused from cache")
+
+            computed = []
+            # One /api/embed call per batch, batches sent concurrently on the shared pool
+            batches = [missing[i:i+self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            embed_batch = lambda batch: self.client.embed_batch(self.embed_model, batch)
+            for batch, batch_results in zip(batches, self.executor.map(embed_batch, batches)):
+                computed.extend(zip(batch, batch_results))
+
+            if computed and self.store is not None:
+                self.store.put_many(self.embed_model, computed)
+            cached.update(computed)
+            return [cached[text] for text in documents]
 
     # --------------------------------------------------------
     # Model warm-up
@@ -117,27 +279,23 @@ class RAG:
         print("[INFO] Preloading Ollama models...")
         try:
             # Warm embedding model
-            requests.post(
-                "http://ollama:11434/api/embeddings",
-                json={"model": self.embed_model, "prompt": "warmup"},
-                timeout=30
-            )
+            self.client.embed(self.embed_model, "warmup", timeout=30)
 
             # Warm LLM
-            requests.post(
-                "http://ollama:11434/api/generate",
-                json={
+            self.client.generate(
+                {
                     "model": self.model,
                     "prompt": "warmup",
-                    "stream": False,
                     "options": {"num_predict": 1},
                 },
                 timeout=30
             )
             print("[INFO] Models ready!")
+            return True
         except Exception as e:
             print(f"Warning: Model preloading failed: {e}")
             print("Continuing anyway - first query may be slower")
+            return False
     
     # --------------------------------------------------------
     # Vectorstore creation
@@ -145,77 +303,243 @@ class RAG:
     def create_vectorstore(self, urls=None, pdfs=None, text=None, recreate=False):
         """Creates the Chroma DB from scratch."""
 
-        # Check if database already exists
-        if os.path.exists(self.persist_dir):
+        # Built only once an ingestion saved its manifest: an interrupted first
+        # ingestion leaves the directory behind without one
+        if os.path.exists(self.manifest_path()) and not recreate:
             print(f"[INFO] Database already exists at {self.persist_dir}.")
-            if not recreate:
-                print("[INFO] Skipping database creation.")
-                return
-            else:
-                print("[INFO] Recreating database...")
-
-        # Load documents
-        print("[INFO] Loading documents...")
-
-        # PDFs
-        docs_list = []
-        for pdf in pdfs:
-            if os.path.exists(pdf):
-                print(f"Loading PDF: {pdf}")
-                loader = PyPDFLoader(pdf)
-                docs_list.extend(loader.load())
-            else:
-                print(f"Warning: PDF file {pdf} not found")
-
-        # URLs
-        for url in urls:
-            try:
-                web_docs = []
-                print(f"Loading URL: {url}")
-                loader = WebBaseLoader(url)
-                web_docs.extend(loader.load())
-                docs_list.extend(web_docs)
-            except Exception as e:
-                print(f"Error loading URL documents: {e}")
-
-        # Plain text
-        for txt in text:
-            docs_list.append({"page_content": txt})
+            print("[INFO] Skipping database creation.")
+            return
+        if recreate and os.path.exists(self.persist_dir):
+            print("[INFO] Recreating database...")
+            shutil.rmtree(self.persist_dir)
+            self.vectorstore = None
+
+        self.ingest(urls or [], pdfs or [], text or [])
+        print(f"[SUCCESS] Vector DB saved at {self.persist_dir}")
 
-        if not docs_list:
-            print("Error: No documents were loaded. Check file paths, URLs and Text.")
+    # --------------------------------------------------------
+    # Incremental ingestion
+    # --------------------------------------------------------
+    def refresh(self):
+        """Re-ingest the configured sources, only new or changed chunks are embedded"""
+        if not self.ready.is_set():
+            # A failed startup can be retried right away instead of waiting for the backoff
+            if self.state == "failed":
+                self.try_initialize()
+            else:
+                print(f"[INFO] Skipping refresh, RAG is {self.state}.")
+            return {"state": self.state}
+        return self.ingest(self.urls, self.pdfs, self.text)
+
+    def start_refresh_job(self, interval):
+        """Run refresh() every `interval` seconds in a background thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Error refreshing vectorstore: {e}")
+
+        threading.Thread(target=run, name="rag-refresh", daemon=True).start()
+        print(f"[INFO] Vectorstore refresh every {interval} seconds.")
+
+    def manifest_path(self):
+        return os.path.join(self.persist_dir, "ingest_manifest.json")
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path()):
             return None
+        with open(self.manifest_path()) as f:
+            return json.load(f)
+
+    def save_manifest(self, manifest):
+        with open(self.manifest_path(), "w") as f:
+            json.dump(manifest, f)
+
+    def content_hash(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return hashlib.sha256(data).hexdigest()
+
+    def file_hash(self, path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def sources(self, urls, pdfs, text):
+        """(kind, source_id, source) for every configured source"""
+        return (
+            [("url", url, url) for url in urls]
+            + [("pdf", pdf, pdf) for pdf in pdfs]
+            + [("text", f"text:{self.content_hash(txt)[:16]}", txt) for txt in text]
+        )
 
-        print(f"[INFO] {len(docs_list)} documents loaded.")
-        
-        # Split documents
-        print("Splitting documents into chunks...")
+    def load_source(self, kind, source_id, source, previous):
+        """
+        Returns (docs, state). docs is None when the source is unchanged since
+        `previous`, and an empty list when the source is gone.
+        """
+        if kind == "url":
+            # Conditional request: an unchanged page answers 304 without a body
+            headers = {"If-None-Match": previous["etag"]} if previous.get("etag") else {}
+            response = requests.get(source, headers=headers, timeout=30)
+            if response.status_code == 304:
+                return None, previous
+            if response.status_code in (404, 410):
+                print(f"Warning: URL {source} is gone")
+                return [], {}
+            response.raise_for_status()
+            state = {"etag": response.headers.get("ETag"), "fingerprint": self.content_hash(response.content)}
+            if previous.get("fingerprint") == state["fingerprint"]:
+                return None, dict(previous, **state)
+            print(f"Loading URL: {source}")
+            return [self.page_document(source, response)], state
+
+        if kind == "pdf":
+            if not os.path.exists(source):
+                print(f"Warning: PDF file {source} not found")
+                return [], {}
+            stat = os.stat(source)
+            if previous.get("mtime") == stat.st_mtime and previous.get("size") == stat.st_size:
+                return None, previous
+            state = {"mtime": stat.st_mtime, "size": stat.st_size, "fingerprint": self.file_hash(source)}
+            if previous.get("fingerprint") == state["fingerprint"]:
+                return None, dict(previous, **state)
+            print(f"Loading PDF: {source}")
+            return PyPDFLoader(source).load(), state
+
+        # Plain text: the source id already is the content hash
+        if previous:
+            return None, previous
+        return [Document(page_content=source, metadata={"source": source_id})], {"fingerprint": source_id}
+
+    def page_document(self, url, response):
+        """Same text and metadata as WebBaseLoader, from the response already downloaded"""
+        soup = BeautifulSoup(response.content, "html.parser")
+        metadata = {"source": url}
+        if soup.find("title"):
+            metadata["title"] = soup.find("title").get_text()
+        return Document(page_content=soup.get_text(), metadata=metadata)
+
+    def split_chunks(self, source_id, docs):
+        """Split documents into chunks keyed by a content hash of (source, chunk text)"""
         splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap
         )
-
-        chunks = splitter.split_documents(docs_list)
-        print(f"[INFO] {len(chunks)} chunks created.")
-
-        # Create embedding function
-        print("Initializing embedding model...")
-        embedding_function = OllamaEmbeddings(model=self.embed_model)
-
-        # Create and persist vectorstore to disk
-        print("Creating vector database...")
-        self.vectorstore = Chroma.from_documents(
-            documents=chunks,
-            collection_name=self.collection_name,
-            embedding=embedding_function,
-            persist_directory=self.persist_dir,
-        )
-
-        # Important: persist to disk
-        # self.vectorstore.persist()
-
-        print(f"Total documentos carregados: {len(docs_list)}")
-        print(f"[SUCCESS] Vector DB saved at {self.persist_dir}")
+        chunks = {}
+        for chunk in splitter.split_documents(docs):
+            chunk_id = self.content_hash(f"{source_id}\n{chunk.page_content}")[:32]
+            chunk.metadata["chunk_id"] = chunk_id
+            chunks[chunk_id] = chunk
+        return chunks
+
+    def ingest(self, urls, pdfs, text):
+        """
+        Incremental ingestion: every source is fingerprinted (URL ETag/content
+        hash, PDF mtime/size/hash, text hash) and compared with the manifest
+        stored next to the Chroma DB. Only new chunks are embedded and added,
+        chunks that disappeared from a source are deleted, and so are the
+        chunks of sources that are no longer configured.
+        Sources go through an IngestPipeline: concurrent loaders, splitter,
+        batched embedding and batched Chroma writes.
+        A source that fails on the first build raises before the manifest is
+        saved, so try_initialize() retries the whole build.
+        """
+        with self.ingest_lock:
+            start_time = time.time()
+            os.makedirs(self.persist_dir, exist_ok=True)
+            vectorstore = self.vectorstore or self.open_vectorstore()
+
+            manifest = self.load_manifest()
+            first_build = manifest is None
+            if manifest is None:
+                # DB built before the manifest existed: chunk ids are unknown, start over
+                existing = vectorstore.get(include=[])["ids"]
+                if existing:
+                    print(f"[INFO] No ingest manifest found, removing {len(existing)} untracked chunks.")
+                    vectorstore.delete(ids=existing)
+                manifest = {}
+
+            new_manifest = {}
+            counts = {"added": 0, "deleted": 0, "unchanged": 0}
+            failed = []
+
+            def load(entry):
+                kind, source_id, source = entry
+                previous = manifest.get(source_id, {})
+                try:
+                    docs, state = self.load_source(kind, source_id, source, previous)
+                except Exception as e:
+                    # Transient failure: keep the chunks we already have
+                    print(f"Error loading {source_id}: {e}")
+                    if previous:
+                        new_manifest[source_id] = previous
+                    else:
+                        failed.append(source_id)
+                    return None
+                return source_id, previous, docs, state
+
+            def split(item):
+                source_id, previous, docs, state = item
+                if docs is None:
+                    counts["unchanged"] += 1
+                    new_manifest[source_id] = state
+                    return []
+
+                chunks = self.split_chunks(source_id, docs)
+                old_ids = set(previous.get("chunk_ids", []))
+                new_ids = [chunk_id for chunk_id in chunks if chunk_id not in old_ids]
+                stale_ids = list(old_ids - chunks.keys())
+                if stale_ids:
+                    vectorstore.delete(ids=stale_ids)
+                counts["added"] += len(new_ids)
+                counts["deleted"] += len(stale_ids)
+                state["chunk_ids"] = list(chunks)
+                new_manifest[source_id] = state
+                return [chunks[chunk_id] for chunk_id in new_ids]
+
+            def embed(chunks):
+                return self.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+
+            def write(chunks, vectors):
+                # Vectors from the embed stage go straight to the collection,
+                # add_documents() would embed the chunks again
+                vectorstore._collection.upsert(
+                    ids=[chunk.metadata["chunk_id"] for chunk in chunks],
+                    embeddings=vectors,
+                    documents=[chunk.page_content for chunk in chunks],
+                    metadatas=[chunk.metadata for chunk in chunks]
+                )
+
+            pipeline = IngestPipeline(
+                load, split, embed, write,
+                loader_workers=self.ingest_workers,
+                embed_workers=self.embed_workers
+            )
+            pipeline.run(self.sources(urls, pdfs, text))
+
+            # Sources removed from the configuration
+            for source_id, previous in manifest.items():
+                if source_id not in new_manifest and previous.get("chunk_ids"):
+                    vectorstore.delete(ids=previous["chunk_ids"])
+                    counts["deleted"] += len(previous["chunk_ids"])
+
+            if failed and first_build:
+                # The manifest marks the DB as built: without it the next startup attempt loads every source again
+                raise RuntimeError(f"Could not load {len(failed)} source(s): {', '.join(failed)}")
+            self.save_manifest(new_manifest)
+            self.update_indexes(vectorstore, changed=bool(counts["added"] or counts["deleted"]))
+            latency = time.time() - start_time
+            if failed:
+                # Not in the manifest, so the next refresh loads them again
+                counts["failed"] = len(failed)
+                print(f"[INFO] Sources not loaded, retried on the next refresh: {', '.join(failed)}")
+            print(f"[INFO] Ingestion finished in {latency:.2f} seconds: {counts['added']} chunks added, {counts['deleted']} deleted, {counts['unchanged']} sources unchanged.")
+            return counts
 
     # --------------------------------------------------------
     # Load existing vectorstore
@@ -225,46 +549,165 @@ class RAG:
         if not os.path.exists(self.persist_dir):
             raise FileNotFoundError("Vectorstore not found. Run create_vectorstore() first.")
 
-        print("Loading existing vector store...")
+        if self.retriever_backend == "numpy":
+            # The memory-mapped index answers queries without a Chroma client
+            if NumpyIndex.exists(self.index_dir):
+                index = NumpyIndex.load(self.index_dir)
+            else:
+                index = self.build_index(self.open_vectorstore())
+            self.vector_retriever = NumpyRetriever(index, self.embeddings, k=self.top_k)
+            print(f"[INFO] NumPy index loaded with {len(index)} chunks.")
+        else:
+            print("Loading existing vector store...")
+
+            self.vectorstore = self.open_vectorstore()
 
-        embedding_function = self.OptimizedOllamaEmbeddings(self.embed_model)
+            self.vector_retriever = self.vectorstore.as_retriever(
+                search_type="similarity",  # Basic similarity is fastest
+                search_kwargs={"k": self.top_k} # Retrieve fewer documents
+            )
+
+            print("[INFO] Vectorstore loaded.")
+
+        self.retriever = self.vector_retriever
+        if self.hybrid:
+            bm25 = BM25Index.load(self.bm25_path) if os.path.exists(self.bm25_path) else self.build_bm25(self.vectorstore or self.open_vectorstore())
+            self.retriever = HybridRetriever(self.vector_search, bm25, k=self.top_k)
+            print(f"[INFO] Hybrid retriever ready, BM25 index with {len(bm25)} chunks.")
 
-        self.vectorstore = Chroma(
+    def open_vectorstore(self):
+        return Chroma(
             collection_name=self.collection_name,
-            embedding_function=embedding_function,
+            embedding_function=self.embeddings,
             persist_directory=self.persist_dir,
         )
 
-        self.retriever = self.vectorstore.as_retriever(
-            search_type="similarity",  # Basic similarity is fastest
-            search_kwargs={"k": 2} # Retrieve fewer documents
+    def update_indexes(self, vectorstore, changed):
+        """Rebuild the derived indexes after an ingestion and swap them into the live retriever"""
+        if changed:
+            self.answer_cache.clear()
+            if self.semantic_cache is not None:
+                self.semantic_cache.clear()
+        if self.retriever_backend == "numpy" and (changed or not NumpyIndex.exists(self.index_dir)):
+            index = self.build_index(vectorstore)
+            if self.vector_retriever:
+                self.vector_retriever = NumpyRetriever(index, self.embeddings, k=self.top_k)
+                if not self.hybrid:
+                    self.retriever = self.vector_retriever
+        if self.hybrid and (changed or not os.path.exists(self.bm25_path)):
+            bm25 = self.build_bm25(vectorstore)
+            if isinstance(self.retriever, HybridRetriever):
+                self.retriever.bm25 = bm25
+
+    def vector_search(self, question, k):
+        """Top-k vector candidates from the active backend"""
+        if self.retriever_backend == "numpy":
+            return self.vector_retriever.search(question, k)
+        return self.vectorstore.similarity_search(question, k=k)
+
+    def build_bm25(self, vectorstore):
+        data = vectorstore.get(include=["documents", "metadatas"])
+        chunks = [
+            {"id": chunk_id, "text": text, "metadata": metadata or {}}
+            for chunk_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+        ]
+        bm25 = BM25Index.build(chunks)
+        bm25.save(self.bm25_path)
+        print(f"[INFO] BM25 index built with {len(bm25)} chunks.")
+        return bm25
+
+    def build_index(self, vectorstore):
+        """Export every chunk and vector from Chroma into the NumPy index"""
+        data = vectorstore.get(include=["embeddings", "documents", "metadatas"])
+        index = NumpyIndex.build(
+            self.index_dir,
+            data["ids"],
+            data["documents"],
+            data["metadatas"],
+            data["embeddings"],
+            ivf_clusters=self.ivf_clusters
         )
-
-        print("[INFO] Vectorstore loaded.")
+        print(f"[INFO] NumPy index built with {len(index)} chunks.")
+        return index
 
     # --------------------------------------------------------
     # Query RAG
     # --------------------------------------------------------
-    def query(self, question):
-        """Generate an answer using the RAG system with optimized processing"""
-        if not self.retriever:
-            raise RuntimeError("Retriever not initialized. Call load_vectorstore().")
-        
-        # Start timing
-        start_time = time.time()
-        
+    def create_rag_prompt(self, docs_content, question):
+        # Simplified RAG prompt for efficiency, sent after the static RAG_SYSTEM_PROMPT
+        return f"""Context:
+{docs_content}
+
+Question: {question}
+
+Answer:"""
+
+    def normalize_question(self, question):
+        return re.sub(r"\s+", " ", question.lower()).strip(" .!?")
+
+    def answer_key(self, question, docs):
+        return self.normalize_question(question), tuple(sorted(chunk_key(doc) for doc in docs))
+
+    def semantic_lookup(self, question, key):
+        """
+        Near-duplicate answer lookup among the answers generated from the same
+        chunks (key[1]), returns (answer or None, query embedding).
+        """
+        if self.semantic_cache is None:
+            return None, None
+        # Already computed by the retriever, served from the embedding store
+        vector = self.embeddings.embed_query(question)
+        answer = self.semantic_cache.get(vector, group=key[1])
+        if answer is not None:
+            print(f"Semantic answer cache hit: {self.semantic_cache.stats()}")
+        return answer, vector
+
+    def store_answer(self, key, vector, answer):
+        self.answer_cache.put(key, answer)
+        if vector is not None:
+            self.semantic_cache.put(key, vector, answer, group=key[1])
+
+    def retrieve(self, question):
+        """
+        Everything before generation: retrieval, then the exact and semantic answer caches.
+        Returns {"answer", "docs", "key", "vector"} where "answer" is set when no
+        generation is needed, or None while the index is not ready.
+        Independent of the classification, so /query can run it speculatively.
+        """
+        if not self.wait_ready():
+            return None
+
         # Retrieve relevant documents
         print(f"Question: {question}")
         print("Retrieving documents...")
-        docs = self.retriever.invoke(question)
-        
+        with timed("retrieval", self.model):
+            docs = self.retriever.invoke(question)
+
         # Early check if we found any relevant documents
         if not docs:
-            end_time = time.time()
-            latency = end_time - start_time
-            print(f"No relevant documents found. Response latency: {latency:.2f} seconds")
-            return "I don't have enough information to answer this question accurately."
-        
+            print("No relevant documents found.")
+            return {"answer": RAG_NO_CONTEXT_MESSAGE, "docs": [], "key": None, "vector": None}
+
+        key = self.answer_key(question, docs)
+        answer = self.answer_cache.get(key)
+        if answer is not None:
+            print(f"Answer cache hit: {self.answer_cache.stats()}")
+            return {"answer": answer, "docs": docs, "key": key, "vector": None}
+        answer, vector = self.semantic_lookup(question, key)
+        return {"answer": answer, "docs": docs, "key": key, "vector": vector}
+
+    def query(self, question, retrieval=None):
+        """Generate an answer using the RAG system, `retrieval` may come from an earlier retrieve()"""
+        # Start timing
+        start_time = time.time()
+
+        retrieval = retrieval or self.retrieve(question)
+        if retrieval is None:
+            return RAG_NOT_READY_MESSAGE
+        if retrieval["answer"] is not None:
+            return retrieval["answer"]
+        docs = retrieval["docs"]
+
         # Process documents - extract only what we need
         docs_content = "\n\n".join(doc.page_content for doc in docs)
         print(f"Retrieved {len(docs)} document chunks")
@@ -283,45 +726,59 @@ class RAG:
         # rag_chain = rag_prompt | self.llm | StrOutputParser()
         # answer = rag_chain.invoke({"context": docs_content, "question": question})
         
-        # Simplified RAG prompt for efficiency
-        rag_prompt = f"""
-            You are an AI assistant specialized in Franzininho documentation.
-            Answer the following question based only on the information provided in the context below.
-            Be concise and direct. If the context doesn't contain relevant information, admit that you don't know.
-
-            Context:
-            {docs_content}
-
-            Question: {question}
-
-            Answer:
-        """
+        rag_prompt = self.create_rag_prompt(docs_content, question)
 
         """Generate response directly from Ollama API"""
-        response = requests.post(
-            "http://ollama:11434/api/generate",
-            json={
-                "model": self.model,
-                "prompt": rag_prompt,
-                "stream": False,
-                "options": {
-                    "num_predict": 512,
-                    "temperature": 0,
-                    "top_k": 40,
-                    "top_p": 0.9,
-                    "seed": 42  # Fixed seed for consistent outputs
-                }
-            }
-        )
-        print(response.json()["response"])
-        if response.status_code == 200:
-            answer = response.json()["response"]
-        else:
-            answer = f"Error: Received status code {response.status_code} from Ollama API"
+        try:
+            response = self.client.generate(
+                {
+                    "model": self.model,
+                    "system": RAG_SYSTEM_PROMPT,
+                    "prompt": rag_prompt,
+                    "options": self.generation_options
+                },
+                priority=PRIORITY_LOW
+            )
+            answer = response["response"]
+            print(answer)
+            self.store_answer(retrieval["key"], retrieval["vector"], answer)
+        except OllamaError as e:
+            answer = str(e)
         
         # Calculate and print latency
         end_time = time.time()
         latency = end_time - start_time
         print(f"Response latency: {latency:.2f} seconds using model: {self.model}")
         
-        return answer
\ No newline at end of file
+        return answer
+
+    def query_stream(self, question, retrieval=None):
+        """Streaming version of query(): yields the answer tokens as Ollama produces them"""
+        start_time = time.time()
+        retrieval = retrieval or self.retrieve(question)
+        if retrieval is None:
+            yield RAG_NOT_READY_MESSAGE
+            return
+        if retrieval["answer"] is not None:
+            yield retrieval["answer"]
+            return
+        docs = retrieval["docs"]
+
+        docs_content = "\n\n".join(doc.page_content for doc in docs)
+        print(f"Retrieved {len(docs)} document chunks")
+        answer = ""
+        try:
+            for token in self.client.generate_stream({
+                "model": self.model,
+                "system": RAG_SYSTEM_PROMPT,
+                "prompt": self.create_rag_prompt(docs_content, question),
+                "options": self.generation_options
+            }, priority=PRIORITY_LOW):
+                answer += token
+                yield token
+            self.store_answer(retrieval["key"], retrieval["vector"], answer)
+        except OllamaError as e:
+            yield str(e)
+
+        latency = time.time() - start_time
+        print(f"Response latency: {latency:.2f} seconds using model: {self.model}")
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from langchain_core.documents import Document
+
+
+def tokenize(text):
+    """
+    Lowercase, accent-free alphanumeric tokens. Identifiers are indexed in both
+    spellings, so "GPIO 12", "gpio12" and "GPIO12" all match each other.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    tokens = []
+    previous = None
+    for token in re.findall(r"[a-z0-9]+", text):
+        tokens.append(token)
+        parts = re.findall(r"[a-z]+|\d+", token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+        elif previous and previous.isalpha() and token.isdigit():
+            tokens.append(previous + token)
+        previous = token
+    return tokens
+
+
+def chunk_key(doc):
+    return doc.metadata.get("chunk_id") or hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()[:32]
+
+
+class BM25Index:
+    """Precomputed inverted index with Okapi BM25 scoring, saved as JSON next to the vectorstore"""
+
+    def __init__(self, chunks, postings, doc_lengths, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.average_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+            for term, entries in postings.items()
+        }
+
+    @classmethod
+    def build(cls, chunks):
+        """chunks: list of {"id", "text", "metadata"}"""
+        postings = defaultdict(list)
+        doc_lengths = []
+        for i, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk["text"]))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((i, tf))
+        return cls(chunks, dict(postings), doc_lengths)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["chunks"], data["postings"], data["doc_lengths"])
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"chunks": self.chunks, "postings": self.postings, "doc_lengths": self.doc_lengths}, f)
+        os.replace(tmp, path)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query, k):
+        """Return [(Document, score)] for the k best BM25 matches"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * self.doc_lengths[i] / (self.average_length or 1)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            (Document(page_content=self.chunks[i]["text"], metadata=dict(self.chunks[i]["metadata"])), score)
+            for i, score in best
+        ]
+
+
+class HybridRetriever:
+    """
+    BM25 and vector candidates merged with reciprocal rank fusion, then
+    reranked on CPU by how well each chunk covers the query terms, with a
+    bonus for exact identifiers such as pin names ("gpio12", "lab01").
+    Only the top k reach the prompt.
+    """
+
+    def __init__(self, vector_search, bm25, k=2, candidates=10, rrf_k=60, coverage_weight=0.02, identifier_weight=0.03):
+        self.vector_search = vector_search
+        self.bm25 = bm25
+        self.k = k
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.coverage_weight = coverage_weight
+        self.identifier_weight = identifier_weight
+
+    def invoke(self, question):
+        fused = {}
+        scores = defaultdict(float)
+        bm25_docs = [doc for doc, _ in self.bm25.search(question, self.candidates)]
+        for results in (self.vector_search(question, self.candidates), bm25_docs):
+            for rank, doc in enumerate(results):
+                key = chunk_key(doc)
+                fused.setdefault(key, doc)
+                scores[key] += 1 / (self.rrf_k + rank + 1)
+
+        query_terms = set(tokenize(question))
+        identifiers = {term for term in query_terms if re.search(r"[a-z]", term) and re.search(r"\d", term)}
+        for key, doc in fused.items():
+            doc_terms = set(tokenize(doc.page_content))
+            if query_terms:
+                scores[key] += self.coverage_weight * len(query_terms & doc_terms) / len(query_terms)
+            scores[key] += self.identifier_weight * len(identifiers & doc_terms)
+
+        ranked = sorted(fused, key=lambda key: scores[key], reverse=True)[:self.k]
+        return [fused[key] for key in ranked]
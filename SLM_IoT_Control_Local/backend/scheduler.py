@@ -0,0 +1,129 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import Future
+from metrics import current_route, observe_stage, set_route
+from ollama_client import OllamaError
+
+# Lower values are served first
+PRIORITY_HIGH = 0    # classification and IoT actuation
+PRIORITY_NORMAL = 1  # short general answers
+PRIORITY_LOW = 2     # long RAG answers
+
+
+class RequestExpired(OllamaError):
+    pass
+
+
+class Job:
+    def __init__(self, key, payload, priority, deadline, timeout, stream=False):
+        self.key = key
+        self.payload = payload
+        self.priority = priority
+        self.deadline = deadline
+        self.timeout = timeout
+        self.future = Future()
+        # Streams keep their worker until the caller is done reading the tokens
+        self.stream = stream
+        self.released = threading.Event()
+        # Metrics of the generation are recorded under the submitting route
+        self.route = current_route()
+        self.queued_at = time.perf_counter()
+
+
+class OllamaScheduler:
+    """
+    Sits between the handlers and OllamaClient.generate():
+    - identical in-flight payloads share one generation (coalescing)
+    - queued jobs are served by priority, then arrival order
+    - jobs whose deadline passed while queued are dropped without calling Ollama
+    Streams wait in the same queue (never coalesced) and hold their worker
+    while the caller reads them, so at most `workers` generations of any kind
+    reach the client. Embedding calls are passed straight to the client.
+    """
+
+    def __init__(self, client, workers=2, default_ttl=120):
+        self.client = client
+        self.default_ttl = default_ttl
+        self.queue = []
+        self.inflight = {}
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.stats = {"submitted": 0, "coalesced": 0, "expired": 0}
+
+        for i in range(workers):
+            threading.Thread(target=self.worker, name=f"ollama-scheduler-{i}", daemon=True).start()
+
+    @property
+    def host(self):
+        return self.client.host
+
+    def generate(self, payload, timeout=None, priority=PRIORITY_NORMAL, ttl=None):
+        key = json.dumps(payload, sort_keys=True)
+        deadline = time.time() + (ttl or self.default_ttl)
+        with self.condition:
+            self.stats["submitted"] += 1
+            job = self.inflight.get(key)
+            if job is not None:
+                # Same prompt already queued or running: wait for its result
+                self.stats["coalesced"] += 1
+                job.deadline = max(job.deadline, deadline)
+            else:
+                job = Job(key, payload, priority, deadline, timeout)
+                self.inflight[key] = job
+                heapq.heappush(self.queue, (priority, next(self.counter), job))
+                self.condition.notify()
+        return job.future.result()
+
+    def generate_stream(self, payload, timeout=None, priority=PRIORITY_NORMAL, ttl=None):
+        job = Job(None, payload, priority, time.time() + (ttl or self.default_ttl), timeout, stream=True)
+        with self.condition:
+            self.stats["submitted"] += 1
+            heapq.heappush(self.queue, (priority, next(self.counter), job))
+            self.condition.notify()
+        # Raises RequestExpired when the deadline passed while queued
+        job.future.result()
+        try:
+            yield from self.client.generate_stream(payload, timeout)
+        finally:
+            job.released.set()
+
+    def embed(self, model, text, timeout=None):
+        return self.client.embed(model, text, timeout)
+
+    def embed_batch(self, model, texts, timeout=None):
+        return self.client.embed_batch(model, texts, timeout)
+
+    def worker(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                _, _, job = heapq.heappop(self.queue)
+                if time.time() > job.deadline:
+                    self.stats["expired"] += 1
+                    self.inflight.pop(job.key, None)
+                    job.future.set_exception(RequestExpired("Error: Request expired while waiting for Ollama"))
+                    continue
+
+            set_route(job.route)
+            observe_stage("queue", time.perf_counter() - job.queued_at, job.payload.get("model", ""))
+            if job.stream:
+                # The caller's thread reads the stream, this worker waits for it to end
+                job.future.set_result(None)
+                job.released.wait()
+                continue
+            try:
+                result = self.client.generate(job.payload, job.timeout)
+            except Exception as e:
+                self.finish(job)
+                job.future.set_exception(e)
+            else:
+                self.finish(job)
+                job.future.set_result(result)
+
+    def finish(self, job):
+        with self.condition:
+            self.inflight.pop(job.key, None)
@@ -1,81 +1,497 @@
-from flask import Flask, request as rq, jsonify
+from flask import Flask, Response, g, request as rq, jsonify, stream_with_context
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
 from dotenv import load_dotenv
+from waitress import serve
 from rag import RAG
 from agent import AGENT
+from automation import RuleEngine
+from devices import DeviceStateStore
+from intent import IntentClassifier
 from iot import IOT
+from mqtt_bridge import MqttBridge
+from ollama_client import OllamaClient
+from ollama_pool import Endpoint, OllamaPool
+from scheduler import OllamaScheduler
+from stream import ndjson
 
 load_dotenv()
 app = Flask(__name__)
 
 OLLAMA_HOST = os.getenv("OLLAMA_HOST")
-MODEL = "gemma3"
+# Several Ollama instances: "http://box1:11434=gemma3,http://box2:11434=nomic-embed-text|gemma3"
+# (without "=models" a host serves every model). Defaults to OLLAMA_HOST.
+OLLAMA_HOSTS = os.getenv("OLLAMA_HOSTS") or OLLAMA_HOST
+if not OLLAMA_HOSTS:
+    raise RuntimeError("OLLAMA_HOST is not set: add e.g. OLLAMA_HOST=http://ollama:11434 to backend/.env (or OLLAMA_HOSTS for several hosts)")
+MODEL = os.getenv("MODEL", "gemma3")
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", "16"))
+SERVER_PORT = int(os.getenv("PORT", "5000"))
+OLLAMA_MAX_GENERATIONS = int(os.getenv("OLLAMA_MAX_GENERATIONS", "2"))
+
+def parse_keep_alive(value):
+    """"gemma3=1h,nomic-embed-text=2h,30m" -> {"gemma3": "1h", "nomic-embed-text": "2h", "*": "30m"}"""
+    keep_alive = {}
+    for item in value.split(","):
+        if item.strip():
+            model, _, duration = item.rpartition("=")
+            keep_alive[model.strip() or "*"] = duration.strip()
+    return keep_alive
+
+def parse_models(value):
+    """"gemma3:1b,gemma3" -> ["gemma3:1b", "gemma3"]: cheapest first, the last one is the fallback"""
+    return [model.strip() for model in value.split(",") if model.strip()] or [MODEL]
+
+# Per-route models; IOT_MODELS and CLASSIFY_MODELS accept a cascade of models
+IOT_MODELS = parse_models(os.getenv("IOT_MODELS", MODEL))
+CLASSIFY_MODELS = parse_models(os.getenv("CLASSIFY_MODELS", MODEL))
+QUERY_MODEL = os.getenv("QUERY_MODEL", MODEL)
+RAG_MODEL = os.getenv("RAG_MODEL", MODEL)
+GENERATION_MODELS = set(IOT_MODELS + CLASSIFY_MODELS + [QUERY_MODEL, RAG_MODEL])
+
+def ollama_endpoint(entry):
+    host, _, models = entry.strip().partition("=")
+    client = OllamaClient(
+        host=host,
+        pool_size=SERVER_THREADS,
+        max_generations=OLLAMA_MAX_GENERATIONS,
+        connect_timeout=float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5")),
+        generate_timeout=float(os.getenv("OLLAMA_GENERATE_TIMEOUT", "120")),
+        embed_timeout=float(os.getenv("OLLAMA_EMBED_TIMEOUT", "30")),
+        keep_alive=parse_keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", "30m"))
+    )
+    return Endpoint(client, [model for model in models.split("|") if model] or None)
+
+# One pooled client per Ollama host, shared by every handler through the pool
+OLLAMA = OllamaPool(
+    [ollama_endpoint(entry) for entry in OLLAMA_HOSTS.split(",") if entry.strip()],
+    health_interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+)
+
+# Priority queue with request coalescing in front of the pool. One worker per
+# generation slot on the hosts that serve generation models: an extra worker
+# would take a low-priority job off the queue only to wait on a host slot,
+# ahead of the classification or IoT job that arrives next.
+SCHEDULER = OllamaScheduler(
+    OLLAMA,
+    workers=OLLAMA_MAX_GENERATIONS * max(1, len(OLLAMA.serving(GENERATION_MODELS))),
+    default_ttl=float(os.getenv("OLLAMA_QUEUE_TTL", "120"))
+)
+
+# Latest state and recent history of each board, so requests can carry only deltas
+DEVICES = DeviceStateStore(
+    history=int(os.getenv("DEVICE_HISTORY", "120")),
+    trend_window=float(os.getenv("DEVICE_TREND_WINDOW", "600"))
+)
+
+# Conditional requests compiled once into rules, checked on every device state update
+AUTOMATION = RuleEngine(
+    client=SCHEDULER,
+    model=IOT_MODELS[-1],
+    max_rules=int(os.getenv("AUTOMATION_MAX_RULES", "16"))
+)
+AUTOMATION_FROM_QUERY = os.getenv("AUTOMATION", "1") == "1"
 
 useIOT = IOT(
-    model=MODEL,
-    ollama_host=OLLAMA_HOST
+    model=IOT_MODELS[-1],
+    cascade=IOT_MODELS[:-1],
+    client=SCHEDULER,
+    cache_size=int(os.getenv("IOT_CACHE_SIZE", "256")),
+    cache_ttl=float(os.getenv("IOT_CACHE_TTL", "300"))
 )
 
+RAG_URLS = [
+    "https://raw.githubusercontent.com/Franzininho/docs-franzininho-site/main/docs/FranzininhoWiFiLAB01/franzininho-wifi-lab01.md",
+    "https://docs.franzininho.com.br/docs/franzininho-wifi/franzininho-wifi/"
+]
+
+def env_list(name, default=()):
+    """Comma-separated list, an empty value means no items"""
+    value = os.getenv(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+def text_sources(directory):
+    """Contents of the .txt and .md files in `directory`, in name order"""
+    if not directory:
+        return []
+    text = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith((".txt", ".md")):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                text.append(f.read())
+    return text
+
 useRAG = RAG(
-    persist_dir="chroma_db",
-    model=MODEL,
-    urls = [
-        "https://raw.githubusercontent.com/Franzininho/docs-franzininho-site/main/docs/FranzininhoWiFiLAB01/franzininho-wifi-lab01.md",
-        "https://docs.franzininho.com.br/docs/franzininho-wifi/franzininho-wifi/"
-    ],
-    pdfs= [],
-    text=[]
+    persist_dir=os.getenv("RAG_PERSIST_DIR", "chroma_db"),
+    model=RAG_MODEL,
+    urls=env_list("RAG_URLS", RAG_URLS),
+    pdfs=env_list("RAG_PDFS"),
+    text=text_sources(os.getenv("RAG_TEXT_DIR")),
+    client=SCHEDULER,
+    embedding_cache_path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db"),
+    retriever_backend=os.getenv("RAG_RETRIEVER", "chroma"),
+    ivf_clusters=int(os.getenv("RAG_IVF_CLUSTERS", "0")),
+    hybrid=os.getenv("RAG_HYBRID", "0") == "1",
+    answer_cache_size=int(os.getenv("RAG_ANSWER_CACHE_SIZE", "128")),
+    answer_cache_ttl=float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600")),
+    semantic_threshold=float(os.getenv("RAG_SEMANTIC_THRESHOLD", "0.95")),
+    ready_timeout=float(os.getenv("RAG_READY_TIMEOUT", "10"))
 )
+# Index loading and model warm-up run in the background, the server binds right away
+useRAG.start()
+
+# Hit rates in /healthz and /metrics
+metrics.CACHES.register("iot", useIOT.cache)
+metrics.CACHES.register("rag_answer", useRAG.answer_cache)
+if useRAG.semantic_cache is not None:
+    metrics.CACHES.register("rag_semantic", useRAG.semantic_cache)
+
+RAG_REFRESH_INTERVAL = float(os.getenv("RAG_REFRESH_INTERVAL", "0"))
+if RAG_REFRESH_INTERVAL > 0:
+    useRAG.start_refresh_job(RAG_REFRESH_INTERVAL)
+
+# "embedding": nearest-prototype intent classifier on the RAG embeddings, the model only for unsure inputs
+INTENT = None
+if os.getenv("CLASSIFIER", "llm") == "embedding":
+    # Without INTENT_TEMPERATURE the softmax temperature is fitted on the intent examples
+    INTENT_TEMPERATURE = os.getenv("INTENT_TEMPERATURE")
+    INTENT = IntentClassifier(useRAG.embeddings, temperature=float(INTENT_TEMPERATURE) if INTENT_TEMPERATURE else None)
+    INTENT.start()
+
+# Speculative /query: retrieval runs while the classifier decides
+SPECULATIVE = os.getenv("SPECULATIVE", "0") == "1"
+SPECULATION = ThreadPoolExecutor(max_workers=SERVER_THREADS, thread_name_prefix="speculative")
 
 useAGENT = AGENT(
-    model=MODEL,
-    ollama_host=OLLAMA_HOST
+    model=CLASSIFY_MODELS[-1],
+    cascade=CLASSIFY_MODELS[:-1],
+    query_model=QUERY_MODEL,
+    client=SCHEDULER,
+    batch_size=int(os.getenv("CLASSIFY_BATCH_SIZE", "16")),
+    batch_wait=float(os.getenv("CLASSIFY_BATCH_WAIT_MS", "10")) / 1000,
+    batch_workers=OLLAMA_MAX_GENERATIONS,
+    intent=INTENT,
+    intent_threshold=float(os.getenv("INTENT_THRESHOLD", "0.6"))
 )
 
+@app.before_request
+def start_timer():
+    g.start_time = time.perf_counter()
+    metrics.set_route(rq.url_rule.rule if rq.url_rule else "unmatched")
+
+@app.after_request
+def record_latency(response):
+    # For streamed responses this is the time until the first byte
+    metrics.HTTP_SECONDS.observe(
+        time.perf_counter() - g.start_time,
+        route=metrics.current_route(),
+        method=rq.method,
+        status=response.status_code
+    )
+    return response
+
+# Liveness: the process is up, with the state of each subsystem
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({
+        "status": "ok",
+        "rag": useRAG.status(),
+        "scheduler": SCHEDULER.stats,
+        "ollama": OLLAMA.status(),
+        "classification_batches": useAGENT.batcher.stats,
+        "devices": DEVICES.stats(),
+        "automation": AUTOMATION.stats(),
+        "caches": metrics.CACHES.stats(),
+        "mqtt": MQTT.status() if MQTT else None
+    })
+
+# Readiness: IoT and general routes need Ollama; ?rag=1 also requires the documentation index
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    ollama_ready = OLLAMA.ping()
+    rag = useRAG.status()
+    ready = ollama_ready and (rq.args.get("rag") != "1" or rag["state"] == "ready")
+    body = {"ready": ready, "ollama": "ready" if ollama_ready else "unreachable", "rag": rag}
+    return jsonify(body), 200 if ready else 503
+
+# Prometheus scrape endpoint: per-route and per-model latency histograms
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/classification", methods=["POST"])
 def classification():
     body = rq.get_json()
     print(body["user_input"])
-    # Agent
-    classification = useAGENT.ask_ollama_for_classification(body["user_input"])
-    print(f"Classification: {classification}")
+    # Agent: keyword rules, then a micro-batched model call
+    result = useAGENT.classify_detailed(body["user_input"])
+    print(f"Classification: {result['classification']}")
+    return jsonify(result)
+
+# Several inputs in one request: {"user_inputs": [...]} -> {"classifications": [...]}
+@app.route("/classification/batch", methods=["POST"])
+def classification_batch():
+    body = rq.get_json()
+    classifications = useAGENT.classify_batch(body["user_inputs"])
     return jsonify({
-        "classification": classification
+        "classifications": classifications
     })
 
-@app.route("/ollama", methods=["POST"]) 
-def ollama():
-    body = rq.get_json()
+# Incremental re-ingestion of the RAG sources
+@app.route("/rag/refresh", methods=["POST"])
+def rag_refresh():
+    return jsonify(useRAG.refresh())
 
-    classification = body["classification"]
-    
+# Boards push sensor readings (full or only the changed fields) between commands
+# The response carries the actions of the rules fired since the last call
+@app.route("/devices/<device_id>/telemetry", methods=["POST"])
+def device_telemetry(device_id):
+    update_device(device_id, rq.get_json())
+    return jsonify({"status": "ok", **AUTOMATION.pending(device_id)})
+
+@app.route("/devices/<device_id>", methods=["GET"])
+def device_state(device_id):
+    state = DEVICES.latest(device_id)
+    if state is None:
+        return jsonify({"error": "Unknown device"}), 404
+    return jsonify({"state": state, "trends": DEVICES.trends(device_id)})
+
+@app.route("/devices/<device_id>/rules", methods=["GET"])
+def device_rules(device_id):
+    return jsonify({"rules": AUTOMATION.device_rules(device_id)})
+
+@app.route("/devices/<device_id>/rules", methods=["POST"])
+def add_device_rule(device_id):
+    text = rq.get_json()["text"]
+    rule = AUTOMATION.compile(text)
+    if rule is None:
+        return jsonify({"error": "Could not compile a rule from the request"}), 422
+    rule, active = AUTOMATION.add(device_id, rule, DEVICES.latest(device_id) or {})
+    return jsonify({"rule": rule, "active": active}), 201
+
+@app.route("/devices/<device_id>/rules/<int:rule_id>", methods=["DELETE"])
+def delete_device_rule(device_id, rule_id):
+    if not AUTOMATION.remove(device_id, rule_id):
+        return jsonify({"error": "Unknown rule"}), 404
+    return jsonify({"status": "ok"})
+
+def update_device(device_id, delta):
+    """Merge a state delta and run the device automation rules on the new state"""
+    state = DEVICES.update(device_id, delta)
+    AUTOMATION.evaluate(device_id, state)
+    # Boards on MQTT get fired actions right away instead of on the next telemetry
+    if MQTT and MQTT.knows(device_id):
+        pending = AUTOMATION.pending(device_id)
+        if pending:
+            MQTT.publish(device_id, "command", pending)
+    return state
+
+def with_device_state(body):
+    """A request with a device_id may carry only changed fields, the rest comes from the state store"""
+    device_id = body.get("device_id")
+    if device_id is None:
+        return body
+    state = update_device(device_id, body)
+    return dict(body, **state, trends=DEVICES.trends(device_id))
+
+def automation_rule(body):
+    """
+    A conditional IoT request from a known board becomes a stored rule.
+    Returns (rule, parsed, response), the IoT result with the rule actions
+    applied when the condition already holds, or None to let the SLM answer
+    as usual.
+    """
+    if not AUTOMATION_FROM_QUERY or body.get("device_id") is None or not AUTOMATION.is_conditional(body["user_input"]):
+        return None
+    rule = AUTOMATION.compile(body["user_input"])
+    if rule is None:
+        return None
+    rule, active = AUTOMATION.add(body["device_id"], rule, body)
+    actuators = AUTOMATION.apply(rule["actions"] if active else {}, body)
+    leds = (bool(actuators["red_led"]), bool(actuators["blue_led"]), bool(actuators["green_led"]))
+    response = json.dumps({
+        "leds": {"red_led": leds[0], "green_led": leds[2], "blue_led": leds[1]},
+        "servo_angle": int(actuators["servo_angle"]),
+        "pomodoro": {"start": False, "stop": False, "minutes": 0},
+        "message": rule["message"]
+    })
+    return rule, (rule["message"], leds, int(actuators["servo_angle"]), (False, False, 0)), response
+
+def missing_state(classification, body):
+    """409 response for an IoT request whose state is neither in the body nor in the store"""
+    missing = DEVICES.missing(body) if classification == "iot" else []
+    if missing:
+        return jsonify({"error": "Unknown device state, send the full snapshot", "missing": missing}), 409
+    return None
+
+def iot_payload(parsed, response):
+    message,(red, blue, green), servo_angle, (pomodoro_start, pomodoro_stop, pomodoro_minutes) = parsed
+    return {
+        "message": message,
+        "red_led": red,
+        "blue_led": blue,
+        "green_led": green,
+        "servo_angle": servo_angle,
+        "pomodoro": {
+            "start": pomodoro_start,
+            "stop": pomodoro_stop,
+            "minutes": pomodoro_minutes,
+        },
+        "response": response
+    }
+
+def dispatch(classification, body, retrieval=None):
     if classification == "iot":
-        message,(red, blue, green), servo_angle, (pomodoro_start, pomodoro_stop, pomodoro_minutes), response = useIOT.query(body)
-        return jsonify({
-            "message": message,
-            "red_led": red,
-            "blue_led": blue,
-            "green_led": green,
-            "servo_angle": servo_angle,
-            "pomodoro": {
-                "start": pomodoro_start,
-                "stop": pomodoro_stop,
-                "minutes": pomodoro_minutes,
-            },
-            "response": response
-        })
+        ruled = automation_rule(body)
+        if ruled:
+            rule, parsed, response = ruled
+            return dict(iot_payload(parsed, response), rule=rule["id"])
+        message, leds, servo_angle, pomodoro, response = useIOT.query(body)
+        return iot_payload((message, leds, servo_angle, pomodoro), response)
     
     elif classification == "documentation":
-        message = useRAG.query(body["user_input"])
-        return jsonify({
+        message = useRAG.query(body["user_input"], retrieval)
+        return {
             "message": message
-        })
+        }
     
     else:
         message = useAGENT.ask_ollama(body["user_input"])
-        return jsonify({
+        return {
             "message": message
-        })
+        }
+
+def dispatch_stream(classification, body, retrieval=None):
+    """
+    Streaming counterpart of dispatch(), yields NDJSON events:
+    {"field": ..., "value": ...} for each IoT actuator field as soon as it is complete,
+    {"token": ...} for each answer token of documentation/general questions,
+    and a final {"done": true, ...} event with the same payload as dispatch().
+    """
+    if classification == "iot":
+        ruled = automation_rule(body)
+        events = useIOT.replay_stream(*ruled[1:]) if ruled else useIOT.query_stream(body)
+        for event in events:
+            if event[0] == "field":
+                yield ndjson({"field": event[1], "value": event[2]})
+            else:
+                payload = iot_payload(event[1], event[2])
+                payload.update({"classification": classification, "done": True})
+                if ruled:
+                    payload["rule"] = ruled[0]["id"]
+                yield ndjson(payload)
+        return
+
+    if classification == "documentation":
+        tokens = useRAG.query_stream(body["user_input"], retrieval)
+    else:
+        tokens = useAGENT.ask_ollama_stream(body["user_input"])
+    message = ""
+    for token in tokens:
+        message += token
+        yield ndjson({"token": token})
+    yield ndjson({"message": message, "classification": classification, "done": True})
+
+def speculate(fn, *args):
+    """Run fn on the speculation pool, metrics stay attributed to the current route"""
+    route = metrics.current_route()
+    def run():
+        metrics.set_route(route)
+        return fn(*args)
+    return SPECULATION.submit(run)
+
+def classify_and_retrieve(user_input):
+    """
+    Returns (classification, retrieval).
+    When the keyword rules cannot decide, RAG retrieval (query embedding,
+    index lookup, answer cache) starts together with the classifier, so a
+    documentation answer can go straight to generation. For other labels
+    the retrieval is cancelled if it has not started, and its result is
+    discarded otherwise. Generation is never started speculatively: the
+    Ollama slots are the scarce resource.
+    """
+    manual = useAGENT.manual_classification(user_input)
+    if manual != "general" or not SPECULATIVE or not useRAG.ready.is_set():
+        return useAGENT.classify(user_input), None
+
+    retrieval = speculate(useRAG.retrieve, user_input)
+    classification = useAGENT.classify(user_input)
+    if classification != "documentation":
+        retrieval.cancel()
+        return classification, None
+    try:
+        return classification, retrieval.result()
+    except Exception as e:
+        print(f"Speculative retrieval failed: {e}")
+        return classification, None
+
+def mqtt_telemetry(device_id, body):
+    update_device(device_id, body)
+    return ()
+
+def mqtt_query(device_id, body):
+    """/query over MQTT: the same NDJSON events as a streamed request, one message each.
+    The generations queue in SCHEDULER by priority like any other request."""
+    body = with_device_state(dict(body, device_id=device_id))
+    classification, retrieval = classify_and_retrieve(body["user_input"])
+    missing = DEVICES.missing(body) if classification == "iot" else []
+    if missing:
+        yield "response", {"error": "Unknown device state, send the full snapshot", "missing": missing, "done": True}
+        return
+    for event in dispatch_stream(classification, body, retrieval):
+        yield "response", event
+
+# Boards publish "<MQTT_PREFIX>/<device_id>/telemetry" and ".../query", and
+# receive ".../response" (streamed answer events) and ".../command" (automation actions)
+MQTT_HOST = os.getenv("MQTT_HOST")
+MQTT = None
+if MQTT_HOST:
+    MQTT = MqttBridge(
+        MQTT_HOST,
+        handlers={"telemetry": mqtt_telemetry, "query": mqtt_query},
+        port=int(os.getenv("MQTT_PORT", "1883")),
+        prefix=os.getenv("MQTT_PREFIX", "slm"),
+        background=("query",),
+        workers=int(os.getenv("MQTT_WORKERS", "4")),
+        username=os.getenv("MQTT_USERNAME"),
+        password=os.getenv("MQTT_PASSWORD")
+    )
+    MQTT.start()
+
+def stream_response(events):
+    return Response(stream_with_context(events), mimetype="application/x-ndjson")
+
+@app.route("/ollama", methods=["POST"]) 
+def ollama():
+    body = with_device_state(rq.get_json())
+    error = missing_state(body["classification"], body)
+    if error:
+        return error
+    if body.get("stream"):
+        return stream_response(dispatch_stream(body["classification"], body))
+    return jsonify(dispatch(body["classification"], body))
+
+# Classification and answer in a single round trip
+@app.route("/query", methods=["POST"])
+def query():
+    body = with_device_state(rq.get_json())
+    print(body["user_input"])
+    classification, retrieval = classify_and_retrieve(body["user_input"])
+    print(f"Classification: {classification}")
+    error = missing_state(classification, body)
+    if error:
+        return error
+    if body.get("stream"):
+        return stream_response(dispatch_stream(classification, body, retrieval))
+    result = dispatch(classification, body, retrieval)
+    result["classification"] = classification
+    return jsonify(result)
     
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+    # Multi-threaded WSGI server: a slow RAG answer only holds its own worker thread
+    serve(app, host="0.0.0.0", port=SERVER_PORT, threads=SERVER_THREADS)
\ No newline at end of file
@@ -0,0 +1,91 @@
+import json
+
+
+def iter_ollama_tokens(response, on_done=None):
+    """
+    Yield the text tokens of a streaming Ollama /api/generate response.
+    on_done receives the final chunk, which carries the timing counters.
+    """
+    for line in response.iter_lines():
+        if not line:
+            continue
+        chunk = json.loads(line)
+        token = chunk.get("response", "")
+        if token:
+            yield token
+        if chunk.get("done"):
+            if on_done:
+                on_done(chunk)
+            break
+
+
+def ndjson(event):
+    """Serialize one stream event as a newline-delimited JSON line"""
+    return json.dumps(event) + "\n"
+
+
+class JSONFieldParser:
+    """
+    Incremental parser for a streamed JSON object.
+    feed() receives raw text chunks and returns the (key, value) pairs of every
+    top-level field whose value became complete, so callers can act on a field
+    before the model has finished writing the rest of the object.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.key_start = None
+        self.key = None
+        self.value_start = None
+
+    def feed(self, chunk):
+        fields = []
+        self.buffer += chunk
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    # Closing quote of a top-level key
+                    if self.depth == 1 and self.key_start is not None and self.key is None:
+                        self.key = json.loads(self.buffer[self.key_start:self.pos + 1])
+                        self.key_start = None
+            elif char == '"':
+                self.in_string = True
+                if self.depth == 1 and self.key is None and self.value_start is None:
+                    self.key_start = self.pos
+            elif char in "{[":
+                self.depth += 1
+            elif char == ":" and self.depth == 1 and self.key is not None and self.value_start is None:
+                self.value_start = self.pos + 1
+            elif char in ",}]" and self.depth == 1:
+                field = self.complete_field()
+                if field:
+                    fields.append(field)
+                if char != ",":
+                    self.depth -= 1
+            elif char in "}]":
+                self.depth -= 1
+
+            self.pos += 1
+        return fields
+
+    def complete_field(self):
+        key, value_start = self.key, self.value_start
+        self.key = None
+        self.value_start = None
+        if key is None or value_start is None:
+            return None
+        try:
+            return key, json.loads(self.buffer[value_start:self.pos])
+        except json.JSONDecodeError:
+            return None
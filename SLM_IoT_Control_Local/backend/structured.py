@@ -0,0 +1,164 @@
+import json
+import math
+
+
+def repair_json(text):
+    """
+    Parse a JSON object that may be truncated or wrapped in extra text.
+    Unterminated strings are closed, a dangling key or trailing comma is
+    dropped and open brackets are closed. A number or literal with nothing
+    after it may be cut ("servo_angle": 9 of 90) and is dropped too.
+    Returns the object or None.
+    """
+    start = text.find("{") if text else -1
+    if start < 0:
+        return None
+    text = text[start:]
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text)
+        return value if isinstance(value, dict) else None
+    except json.JSONDecodeError:
+        pass
+
+    if scan(text)[1]:
+        text = text.rstrip("\\") + '"'
+    # Try the longest prefix first, then back off to the last complete value
+    candidates = [] if text.rstrip()[-1:].isalnum() or text.rstrip()[-1:] in "+-." else [text]
+    for i in range(len(text) - 1, -1, -1):
+        if text[i] in ",{[":
+            candidates.append(text[:i + 1] if text[i] != "," else text[:i])
+    for candidate in candidates:
+        candidate = candidate.rstrip().rstrip(",")
+        closing = "".join(reversed(scan(candidate)[0]))
+        try:
+            value = json.loads(candidate + closing)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+
+def scan(text):
+    """Return (closing brackets still open, whether a string is still open)"""
+    stack = []
+    in_string = False
+    escape = False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    return stack, in_string
+
+
+def coerce(value, schema, default=None):
+    """
+    Fit a decoded value to a JSON schema: missing or invalid values fall back to
+    `default`, numbers are rounded and clamped to minimum/maximum and strings
+    cut to maxLength.
+    """
+    kind = schema.get("type")
+    if kind == "object":
+        value = value if isinstance(value, dict) else {}
+        default = default if isinstance(default, dict) else {}
+        return {
+            name: coerce(value.get(name), prop, default.get(name))
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if kind == "boolean":
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)):
+            return bool(value)
+        if isinstance(value, str) and value.strip().lower() in ("true", "false", "on", "off"):
+            return value.strip().lower() in ("true", "on")
+        return bool(default)
+    if kind == "integer":
+        try:
+            number = int(round(float(value)))
+        except (TypeError, ValueError, OverflowError):
+            number = int(default or 0)
+        if "minimum" in schema:
+            number = max(schema["minimum"], number)
+        if "maximum" in schema:
+            number = min(schema["maximum"], number)
+        return number
+    if kind == "string":
+        text = value if isinstance(value, str) else (default or "")
+        return text[:schema["maxLength"]] if "maxLength" in schema else text
+    return value if value is not None else default
+
+
+def largest_instance(schema):
+    """The longest value the schema allows, used to size the token budget"""
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: largest_instance(prop) for name, prop in schema.get("properties", {}).items()}
+    if kind == "boolean":
+        return False
+    if kind == "array":
+        return [largest_instance(schema.get("items", {}))] * schema.get("maxItems", 8)
+    if kind == "integer":
+        return -abs(schema.get("maximum", 10 ** 6)) if schema.get("minimum", -1) < 0 else schema.get("maximum", 10 ** 6)
+    if kind == "number":
+        return -abs(schema.get("maximum", 10 ** 6)) - 0.25
+    if kind == "string":
+        if "enum" in schema:
+            return max(schema["enum"], key=len)
+        return "x" * schema.get("maxLength", 256)
+    return None
+
+
+def token_budget(schema, chars_per_token=3, margin=16):
+    """num_predict that fits the largest schema-valid output, pretty-printed"""
+    text = json.dumps(largest_instance(schema), indent=2)
+    return math.ceil(len(text) / chars_per_token) + margin
+
+
+def validate(value, schema, path="$"):
+    """Problems that coerce() would have to fix, empty when `value` already matches the schema"""
+    kind = schema.get("type")
+    if kind == "object":
+        if not isinstance(value, dict):
+            return [f"{path} is not an object"]
+        problems = [f"{path}.{name} is missing" for name in schema.get("required", []) if name not in value]
+        for name, prop in schema.get("properties", {}).items():
+            if name in value:
+                problems.extend(validate(value[name], prop, f"{path}.{name}"))
+        return problems
+    if kind == "array":
+        if not isinstance(value, list):
+            return [f"{path} is not an array"]
+        if not schema.get("minItems", 0) <= len(value) <= schema.get("maxItems", len(value)):
+            return [f"{path} has {len(value)} items"]
+        problems = []
+        for i, item in enumerate(value):
+            problems.extend(validate(item, schema.get("items", {}), f"{path}[{i}]"))
+        return problems
+    if kind == "boolean" and not isinstance(value, bool):
+        return [f"{path} is not a boolean"]
+    if kind == "integer" and (not isinstance(value, int) or isinstance(value, bool)):
+        return [f"{path} is not an integer"]
+    if kind == "number" and (not isinstance(value, (int, float)) or isinstance(value, bool)):
+        return [f"{path} is not a number"]
+    if kind in ("integer", "number"):
+        if value < schema.get("minimum", value) or value > schema.get("maximum", value):
+            return [f"{path} is out of range"]
+    if kind == "string":
+        if not isinstance(value, str):
+            return [f"{path} is not a string"]
+        if len(value) > schema.get("maxLength", len(value)):
+            return [f"{path} is too long"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path} is not one of {schema['enum']}"]
+    return []
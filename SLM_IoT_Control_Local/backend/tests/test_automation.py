@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from automation import RuleEngine
+
+HOT = {
+    "text": "se a temperatura passar de 25, ligue o led azul",
+    "conditions": [{"field": "temperature", "op": ">", "value": 25}],
+    "actions": {"blue_led": True},
+    "message": "Quente: LED azul ligado.",
+}
+HOT_AND_PRESSED = dict(HOT, conditions=HOT["conditions"] + [{"field": "btn_pressed", "op": "==", "value": 1}])
+
+# rule, state when the rule is added, later states -> times the rule fired
+EDGES = [
+    (HOT, {"temperature": 20}, [{"temperature": 26}, {"temperature": 27}, {"temperature": 28}], 1),
+    (HOT, {"temperature": 20}, [{"temperature": 26}, {"temperature": 20}, {"temperature": 26}], 2),
+    (HOT, {"temperature": 26}, [{"temperature": 27}], 0),
+    (HOT, {"temperature": 26}, [{"temperature": 20}, {"temperature": 27}], 1),
+    (HOT, {"temperature": 20}, [{"temperature": 24}, {"temperature": 25}], 0),
+    (HOT, {}, [{"humidity": 50}, {"temperature": 26}], 1),
+    (HOT_AND_PRESSED, {"temperature": 26, "btn_pressed": False}, [{"temperature": 27, "btn_pressed": False}, {"temperature": 27, "btn_pressed": True}], 1),
+    (HOT_AND_PRESSED, {"temperature": 20, "btn_pressed": True}, [{"temperature": 26, "btn_pressed": True}, {"temperature": 26, "btn_pressed": False}], 1),
+]
+
+
+@pytest.mark.parametrize("rule, initial, states, fired", EDGES)
+def test_rules_fire_on_the_rising_edge(rule, initial, states, fired):
+    engine = RuleEngine(client=None, model="gemma3")
+    added, active = engine.add("board", rule, initial)
+    assert active == engine.matches(rule, initial)
+    for state in states:
+        engine.evaluate("board", state)
+    assert engine.device_rules("board")[0]["fired"] == fired
+    assert engine.stats() == {"rules": 1, "fired": fired}
+
+
+def test_fired_actions_wait_in_the_outbox_once():
+    engine = RuleEngine(client=None, model="gemma3")
+    engine.add("board", HOT, {"temperature": 20})
+    engine.add("board", dict(HOT, actions={"servo_angle": 90}, message="Servo em 90."), {"temperature": 20})
+    engine.evaluate("board", {"temperature": 30})
+    engine.evaluate("other", {"temperature": 30})
+    assert engine.pending("board") == {"actions": {"blue_led": True, "servo_angle": 90}, "message": "Quente: LED azul ligado. Servo em 90."}
+    assert engine.pending("board") == {}
+    assert engine.pending("other") == {}
+
+
+def test_only_the_newest_rules_are_kept():
+    engine = RuleEngine(client=None, model="gemma3", max_rules=2)
+    ids = [engine.add("board", HOT, {})[0]["id"] for _ in range(3)]
+    assert [rule["id"] for rule in engine.device_rules("board")] == ids[1:]
+    assert engine.remove("board", ids[1])
+    assert not engine.remove("board", ids[1])
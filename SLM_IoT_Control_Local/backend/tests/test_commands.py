@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands import CommandCompiler
+
+STATE = {
+    "temperature": 24.0, "humidity": 60.0, "btn_pressed": False,
+    "led_red": False, "led_blue": False, "led_green": False,
+    "ldr_value": 1000, "servo_angle": 0,
+}
+
+
+def compile_command(user_input, **state):
+    return CommandCompiler().compile(dict(STATE, **state, user_input=user_input))
+
+
+# user_input -> (leds, servo_angle, pomodoro)
+COMPILED = [
+    ("Ligue o LED vermelho", (True, False, False), 0, (False, False, 0)),
+    ("Acenda os leds azul e verde", (False, True, True), 0, (False, False, 0)),
+    ("Turn on the blue LED", (False, True, False), 0, (False, False, 0)),
+    ("Coloque o servo em 90 graus", (False, False, False), 90, (False, False, 0)),
+    ("Gire o servo para 45°", (False, False, False), 45, (False, False, 0)),
+    ("Coloque o servo em 120", (False, False, False), 120, (False, False, 0)),
+    ("Set the servo to 30 degrees", (False, False, False), 30, (False, False, 0)),
+    ("Inicie um pomodoro de 10 minutos", (False, False, False), 0, (True, False, 10)),
+    ("Inicie pomodoro 15min", (False, False, False), 0, (True, False, 15)),
+    ("Inicie o pomodoro", (False, False, False), 0, (True, False, 25)),
+    ("Pare o pomodoro", (False, False, False), 0, (False, True, 0)),
+]
+
+# Inputs that must go to the SLM instead of actuating right away
+NOT_COMPILED = [
+    "não ligue o led vermelho",
+    "nao ligue o led vermelho",
+    "don't turn on the red led",
+    "do not turn on the red led",
+    "nunca acenda o led azul",
+    "ligue o led azul em 10 minutos",
+    "ligue o led azul depois de 5 minutos",
+    "ligue o led azul por 5 minutos",
+    "ligue o led azul às 10 horas",
+    "inicie pomodoro de 1 hora",
+    "inicie o pomodoro às 14h",
+    "inicie o pomodoro às 14",
+    "inicie pomodoro de 10 minutos e depois 5 minutos",
+    "inicie pomodoro de 200 minutos",
+    "coloque o servo em 200 graus",
+    "gire o servo 2 vezes",
+    "servo para -10 graus",
+    "ligue o led vermelho depois",
+    "inicie o pomodoro amanhã",
+    "ligue o led azul daqui a pouco",
+    "turn on the red led later",
+    "se estiver quente ligue o led azul",
+    "Qual a temperatura?",
+    "ligue o led vermelho e o servo em 90",
+]
+
+
+@pytest.mark.parametrize("user_input, leds, servo_angle, pomodoro", COMPILED)
+def test_compiles_unambiguous_commands(user_input, leds, servo_angle, pomodoro):
+    compiled = compile_command(user_input)
+    assert compiled is not None
+    assert compiled[1:4] == (leds, servo_angle, pomodoro)
+
+
+@pytest.mark.parametrize("user_input", NOT_COMPILED)
+def test_leaves_other_inputs_to_the_slm(user_input):
+    assert compile_command(user_input) is None
+
+
+def test_turning_off_keeps_other_leds():
+    compiled = compile_command("Desligue o LED vermelho", led_red=True, led_blue=True)
+    assert compiled[1] == (False, True, False)
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import devices
+from devices import DeviceStateStore
+
+# deltas sent by a board, oldest first -> trends()
+TRENDS = [
+    ([{"temperature": 20.0}], {}),
+    ([{"temperature": 20.0}, {"temperature": 21.0}], {"temperature": "rising"}),
+    ([{"temperature": 21.0}, {"temperature": 20.8}], {"temperature": "stable"}),
+    ([{"temperature": 20.0}, {"temperature": 20.5}], {"temperature": "rising"}),
+    ([{"humidity": 60.0}, {"humidity": 55.0}], {"humidity": "falling"}),
+    ([{"temperature": 20.0, "ldr_value": 1000}, {"ldr_value": 1500}], {"temperature": "stable", "ldr_value": "rising"}),
+    ([{"temperature": 20.0}, {"led_red": True}, {"temperature": 19.0}], {"temperature": "falling"}),
+    ([{"led_red": True}, {"led_red": False}], {}),
+]
+
+
+@pytest.mark.parametrize("deltas, expected", TRENDS)
+def test_trends(deltas, expected):
+    store = DeviceStateStore()
+    for delta in deltas:
+        store.update("board", delta)
+    assert store.trends("board") == expected
+
+
+def test_trends_only_read_the_window(monkeypatch):
+    store = DeviceStateStore(trend_window=60)
+    now = 1000.0
+    monkeypatch.setattr(devices.time, "time", lambda: now)
+    store.update("board", {"temperature": 15.0})
+    now += 120
+    store.update("board", {"temperature": 20.0})
+    now += 1
+    store.update("board", {"temperature": 20.1})
+    assert store.trends("board") == {"temperature": "stable"}
+    assert store.trends("board", window=600) == {"temperature": "rising"}
+
+
+def test_update_merges_deltas_and_ignores_unknown_fields():
+    store = DeviceStateStore()
+    store.update("board", {"temperature": 20.0, "led_red": False})
+    state = store.update("board", {"led_red": True, "user_input": "oi"})
+    assert state == {"temperature": 20.0, "led_red": True}
+    assert store.missing(state) == ["humidity", "btn_pressed", "led_blue", "led_green", "ldr_value", "servo_angle"]
@@ -0,0 +1,103 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama_client import OllamaError
+from ollama_pool import Endpoint, OllamaPool
+
+SERVER_ERROR = OllamaError("Error: 500", status=500)
+CONNECTION_ERROR = OllamaError("Error: connection refused")
+NOT_FOUND = OllamaError("Error: model not found", status=404)
+
+
+class FakeHost:
+    """Answers with its host name, or raises `error` after yielding `tokens` stream tokens"""
+
+    def __init__(self, host, error=None, tokens=0):
+        self.host = host
+        self.error = error
+        self.tokens = tokens
+        self.calls = 0
+
+    def generate(self, payload, timeout=None):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return {"response": self.host}
+
+    def generate_stream(self, payload, timeout=None):
+        self.calls += 1
+        for i in range(self.tokens):
+            yield f"{self.host}-{i} "
+        if self.error:
+            raise self.error
+        yield self.host
+
+
+def make_pool(*hosts):
+    return OllamaPool([Endpoint(host) for host in hosts], health_interval=0)
+
+
+# host errors -> (answering host or the status raised, calls per host)
+FAILOVER_CASES = [
+    ([None, None], "a", [1, 0]),
+    ([SERVER_ERROR, None], "b", [1, 1]),
+    ([CONNECTION_ERROR, None], "b", [1, 1]),
+    ([NOT_FOUND, None], 404, [1, 0]),
+    ([SERVER_ERROR, SERVER_ERROR], 500, [1, 1]),
+]
+
+
+@pytest.mark.parametrize("errors, expected, calls", FAILOVER_CASES)
+def test_generate_fails_over_on_server_errors(errors, expected, calls):
+    hosts = [FakeHost(name, error) for name, error in zip("ab", errors)]
+    pool = make_pool(*hosts)
+    if isinstance(expected, int):
+        with pytest.raises(OllamaError) as raised:
+            pool.generate({"model": "gemma3", "prompt": "hi"})
+        assert raised.value.status == expected
+    else:
+        assert pool.generate({"model": "gemma3", "prompt": "hi"})["response"] == expected
+    assert [host.calls for host in hosts] == calls
+    assert [endpoint.outstanding for endpoint in pool.endpoints] == [0, 0]
+
+
+def test_failed_host_is_marked_unhealthy():
+    pool = make_pool(FakeHost("a", SERVER_ERROR), FakeHost("b"))
+    pool.generate({"model": "gemma3", "prompt": "hi"})
+    assert [endpoint.healthy for endpoint in pool.endpoints] == [False, True]
+
+
+def test_pinned_hosts_take_their_model():
+    general, embedder = FakeHost("a"), FakeHost("b")
+    pool = OllamaPool([Endpoint(general), Endpoint(embedder, ["nomic-embed-text"])], health_interval=0)
+    assert pool.generate({"model": "nomic-embed-text:latest"})["response"] == "b"
+    assert pool.generate({"model": "gemma3"})["response"] == "a"
+
+
+# (first host error, tokens it yields before failing) -> stream text or the status raised
+STREAM_CASES = [
+    (None, 0, "a"),
+    (SERVER_ERROR, 0, "b"),
+    (CONNECTION_ERROR, 0, "b"),
+    (SERVER_ERROR, 1, 500),
+    (NOT_FOUND, 0, 404),
+]
+
+
+@pytest.mark.parametrize("error, tokens, expected", STREAM_CASES)
+def test_stream_is_only_retried_before_the_first_token(error, tokens, expected):
+    first, second = FakeHost("a", error, tokens), FakeHost("b")
+    pool = make_pool(first, second)
+    stream = pool.generate_stream({"model": "gemma3", "prompt": "hi"})
+    if isinstance(expected, int):
+        with pytest.raises(OllamaError) as raised:
+            "".join(stream)
+        assert raised.value.status == expected
+        assert second.calls == 0
+    else:
+        assert "".join(stream) == expected
+    assert [endpoint.outstanding for endpoint in pool.endpoints] == [0, 0]
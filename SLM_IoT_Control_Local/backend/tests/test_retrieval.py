@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval import BM25Index, tokenize
+
+TOKENS = [
+    ("LED vermelho", ["led", "vermelho"]),
+    ("Ação, função!", ["acao", "funcao"]),
+    ("GPIO 12", ["gpio", "12", "gpio12"]),
+    ("gpio12", ["gpio12", "gpio", "12"]),
+    ("Franzininho WiFi LAB01", ["franzininho", "wifi", "lab01", "lab", "01"]),
+    ("ESP32-S2", ["esp32", "esp", "32", "s2", "s", "2"]),
+    ("12 GPIO", ["12", "gpio"]),
+    ("", []),
+]
+
+
+@pytest.mark.parametrize("text, tokens", TOKENS)
+def test_tokenize(text, tokens):
+    assert tokenize(text) == tokens
+
+
+CHUNKS = [
+    {"id": "led", "text": "O LED fica no GPIO 12 da Franzininho WiFi LAB01.", "metadata": {}},
+    {"id": "servo", "text": "O sinal do servo fica no GPIO14.", "metadata": {}},
+    {"id": "esp", "text": "A placa usa o microcontrolador ESP32-S2.", "metadata": {}},
+]
+
+# query -> ids of the chunks found, best first
+SEARCHES = [
+    ("gpio12", ["led", "servo"]),
+    ("GPIO 14", ["servo", "led"]),
+    ("Qual microcontrolador?", ["esp"]),
+    ("bolo de chocolate", []),
+]
+
+
+@pytest.mark.parametrize("query, ids", SEARCHES)
+def test_bm25_search(query, ids):
+    index = BM25Index.build(CHUNKS)
+    texts = {chunk["text"]: chunk["id"] for chunk in CHUNKS}
+    assert [texts[doc.page_content] for doc, _ in index.search(query, k=3)] == ids
@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, OllamaScheduler, RequestExpired
+
+
+class FakeClient:
+    """Records the prompts it generates, every call waits for `gate`"""
+
+    def __init__(self):
+        self.calls = []
+        self.gate = threading.Event()
+
+    def generate(self, payload, timeout=None):
+        self.gate.wait(5)
+        self.calls.append(payload["prompt"])
+        return {"response": payload["prompt"]}
+
+    def generate_stream(self, payload, timeout=None):
+        self.gate.wait(5)
+        self.calls.append(payload["prompt"])
+        yield payload["prompt"]
+
+
+def wait_until(condition):
+    deadline = time.time() + 5
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.001)
+
+
+def submit(scheduler, prompt, priority=PRIORITY_NORMAL, stream=False, ttl=None):
+    """Run the request in a thread, its result or exception ends up in `results[prompt]`"""
+    results = {}
+
+    def run():
+        payload = {"model": "m", "prompt": prompt}
+        try:
+            if stream:
+                results[prompt] = "".join(scheduler.generate_stream(payload, priority=priority, ttl=ttl))
+            else:
+                results[prompt] = scheduler.generate(payload, priority=priority, ttl=ttl)["response"]
+        except Exception as e:
+            results[prompt] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, results
+
+
+def blocked_scheduler():
+    """One worker, busy with a first request until client.gate is set"""
+    client = FakeClient()
+    scheduler = OllamaScheduler(client, workers=1)
+    thread, _ = submit(scheduler, "first")
+    wait_until(lambda: scheduler.stats["submitted"] == 1 and not scheduler.queue)
+    return client, scheduler, thread
+
+
+# Requests queued behind a busy worker, (prompt, priority, stream) -> order they reach the client
+PRIORITY_CASES = [
+    ([("rag", PRIORITY_LOW, False), ("iot", PRIORITY_HIGH, False), ("general", PRIORITY_NORMAL, False)], ["iot", "general", "rag"]),
+    ([("a", PRIORITY_NORMAL, False), ("b", PRIORITY_NORMAL, False), ("c", PRIORITY_NORMAL, False)], ["a", "b", "c"]),
+    ([("rag", PRIORITY_LOW, True), ("iot", PRIORITY_HIGH, False)], ["iot", "rag"]),
+    ([("general", PRIORITY_NORMAL, False), ("iot", PRIORITY_HIGH, True)], ["iot", "general"]),
+]
+
+
+@pytest.mark.parametrize("jobs, order", PRIORITY_CASES)
+def test_serves_by_priority_then_arrival(jobs, order):
+    client, scheduler, first = blocked_scheduler()
+    threads = []
+    for i, (prompt, priority, stream) in enumerate(jobs):
+        threads.append(submit(scheduler, prompt, priority, stream)[0])
+        wait_until(lambda: len(scheduler.queue) == i + 1)
+    client.gate.set()
+    for thread in [first, *threads]:
+        thread.join(5)
+    assert client.calls == ["first", *order]
+
+
+def test_coalesces_identical_payloads():
+    client, scheduler, first = blocked_scheduler()
+    requests = [submit(scheduler, "same") for _ in range(3)]
+    wait_until(lambda: scheduler.stats["submitted"] == 4)
+    client.gate.set()
+    for thread, _ in requests:
+        thread.join(5)
+    assert client.calls == ["first", "same"]
+    assert [results["same"] for _, results in requests] == ["same"] * 3
+    assert scheduler.stats["coalesced"] == 2
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_drops_requests_expired_in_the_queue(stream):
+    client, scheduler, first = blocked_scheduler()
+    thread, results = submit(scheduler, "late", stream=stream, ttl=0.01)
+    wait_until(lambda: len(scheduler.queue) == 1)
+    time.sleep(0.05)
+    client.gate.set()
+    thread.join(5)
+    assert isinstance(results["late"], RequestExpired)
+    assert client.calls == ["first"]
+    assert scheduler.stats["expired"] == 1
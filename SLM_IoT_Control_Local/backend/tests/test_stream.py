@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream import JSONFieldParser
+
+# streamed chunks -> top-level fields reported, in order
+FIELDS = [
+    (['{"servo_angle": 90, "message": "ok"}'], [("servo_angle", 90), ("message", "ok")]),
+    (list('{"servo_angle": 90, "message": "ok"}'), [("servo_angle", 90), ("message", "ok")]),
+    (['{"leds": {"red_led": tr', 'ue, "blue_led": false}, "servo', '_angle": 45}'],
+     [("leds", {"red_led": True, "blue_led": False}), ("servo_angle", 45)]),
+    (['{"message": "a, {b} [c] \\"d\\"", "x": 1}'], [("message", 'a, {b} [c] "d"'), ("x", 1)]),
+    (['{"items": [1, 2, {"k": 3}], "done": true}'], [("items", [1, 2, {"k": 3}]), ("done", True)]),
+    (['{"servo_angle": 90, "message": "Servo em 9'], [("servo_angle", 90)]),
+    (['{"servo_angle": 9'], []),
+    (['Sure! ', '{"a": null}'], [("a", None)]),
+]
+
+
+@pytest.mark.parametrize("chunks, expected", FIELDS)
+def test_reports_each_field_once_complete(chunks, expected):
+    parser = JSONFieldParser()
+    fields = []
+    for chunk in chunks:
+        fields.extend(parser.feed(chunk))
+    assert fields == expected
+
+
+def test_field_is_reported_with_the_chunk_that_completes_it():
+    parser = JSONFieldParser()
+    assert parser.feed('{"leds": {"red_led": true}') == []
+    assert parser.feed(', "servo_angle": 1') == [("leds", {"red_led": True})]
+    assert parser.feed("80}") == [("servo_angle", 180)]
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structured import repair_json
+
+REPAIRED = [
+    ('{"servo_angle": 90}', {"servo_angle": 90}),
+    ('Sure! {"servo_angle": 90} done', {"servo_angle": 90}),
+    ('{"leds": tr', {}),
+    ('{"leds": {"red_led": true, "green_led": fa', {"leds": {"red_led": True}}),
+    ('{"servo_angle": 90, "message": "Servo em 9', {"servo_angle": 90, "message": "Servo em 9"}),
+    ('{"servo_angle": 90, "mess', {"servo_angle": 90}),
+    ('{"servo_angle": 90,', {"servo_angle": 90}),
+    ('{"servo_angle": 9', {}),
+    ('{"leds": {"red_led": true}, "servo_angle": 4', {"leds": {"red_led": True}}),
+    ('{"pomodoro": {"start": true, "minutes": 2', {"pomodoro": {"start": True}}),
+    ('{"servo_angle": 90, "leds": {"red_led": true', {"servo_angle": 90, "leds": {}}),
+    ('{"servo_angle": -', {}),
+]
+
+
+@pytest.mark.parametrize("text, expected", REPAIRED)
+def test_repairs_truncated_objects(text, expected):
+    assert repair_json(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "Error", "[1, 2]"])
+def test_returns_none_without_an_object(text):
+    assert repair_json(text) is None
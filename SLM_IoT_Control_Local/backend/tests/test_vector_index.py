@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import NumpyIndex
+
+IDS = ["x", "y", "xy", "z"]
+VECTORS = [[1, 0, 0], [0, 2, 0], [1, 1, 0], [0, 0, 3]]
+
+# query vector, k -> ids found, best first
+SEARCHES = [
+    ([1, 0, 0], 1, ["x"]),
+    ([5, 0, 0], 2, ["x", "xy"]),
+    ([0, 1, 0.1], 2, ["y", "xy"]),
+    ([0.1, 0, 1], 2, ["z", "x"]),
+    ([1, 1, 0], 1, ["xy"]),
+    ([1, 0.5, 0], 10, ["xy", "x", "y", "z"]),
+]
+
+
+def build(path, ids=IDS, vectors=VECTORS, **kwargs):
+    return NumpyIndex.build(str(path), ids, [f"text {i}" for i in ids], [{"source": i} for i in ids], vectors, **kwargs)
+
+
+@pytest.mark.parametrize("query, k, ids", SEARCHES)
+def test_search_ranks_by_cosine_similarity(tmp_path, query, k, ids):
+    results = build(tmp_path).search(query, k)
+    assert [chunk["id"] for chunk, _ in results] == ids
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    assert all(-1 <= score <= 1.0001 for score in scores)
+
+
+def test_search_reloads_from_disk(tmp_path):
+    build(tmp_path)
+    index = NumpyIndex.load(str(tmp_path))
+    assert len(index) == 4
+    assert index.search([0, 3, 0], 1)[0][0] == {"id": "y", "text": "text y", "metadata": {"source": "y"}}
+
+
+def test_empty_index(tmp_path):
+    index = build(tmp_path, ids=[], vectors=[])
+    assert len(index) == 0
+    assert index.search([1, 0, 0], 3) == []
+
+
+def test_ivf_probes_the_closest_clusters(tmp_path):
+    index = build(tmp_path, ivf_clusters=2, nprobe=2)
+    assert index.centroids is not None
+    assert [chunk["id"] for chunk, _ in index.search([1, 0, 0], 1)] == ["x"]
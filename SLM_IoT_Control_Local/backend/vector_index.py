@@ -0,0 +1,129 @@
+import json
+import os
+import numpy as np
+from langchain_core.documents import Document
+
+
+class NumpyIndex:
+    """
+    In-process vector index: a pre-normalized float32 matrix memory-mapped from
+    disk, searched exactly with one vectorized dot product. For larger corpora
+    an IVF layer (k-means coarse clusters) restricts the search to the `nprobe`
+    closest clusters.
+    """
+
+    def __init__(self, path, matrix, chunks, centroids=None, assignments=None, nprobe=4):
+        self.path = path
+        self.matrix = matrix
+        self.chunks = chunks
+        self.centroids = centroids
+        self.assignments = assignments
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, path, ids, texts, metadatas, embeddings, ivf_clusters=0, nprobe=4):
+        """Normalize and save the vectors plus chunk texts, then return the loaded index"""
+        os.makedirs(path, exist_ok=True)
+        if len(ids):
+            matrix = np.array(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        else:
+            # No sources loaded yet: an empty index that search() answers with []
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+
+        cls.save_array(path, "vectors.npy", matrix)
+        if ivf_clusters and len(ids) > ivf_clusters:
+            centroids, assignments = cls.kmeans(matrix, ivf_clusters)
+            cls.save_array(path, "centroids.npy", centroids)
+            cls.save_array(path, "assignments.npy", assignments)
+        else:
+            for name in ("centroids.npy", "assignments.npy"):
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+
+        chunks = [{"id": i, "text": t, "metadata": m or {}} for i, t, m in zip(ids, texts, metadatas)]
+        tmp = os.path.join(path, "chunks.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(chunks, f)
+        os.replace(tmp, os.path.join(path, "chunks.json"))
+        return cls.load(path, nprobe)
+
+    @classmethod
+    def load(cls, path, nprobe=4):
+        matrix = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path, "chunks.json")) as f:
+            chunks = json.load(f)
+        centroids = assignments = None
+        if os.path.exists(os.path.join(path, "centroids.npy")):
+            centroids = np.load(os.path.join(path, "centroids.npy"))
+            assignments = np.load(os.path.join(path, "assignments.npy"))
+        return cls(path, matrix, chunks, centroids, assignments, nprobe)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "vectors.npy")) and os.path.exists(os.path.join(path, "chunks.json"))
+
+    @staticmethod
+    def save_array(path, name, array):
+        tmp = os.path.join(path, f"{name}.tmp.npy")
+        np.save(tmp, array)
+        os.replace(tmp, os.path.join(path, name))
+
+    @staticmethod
+    def kmeans(matrix, clusters, iterations=10, seed=42):
+        """Spherical k-means, returns (normalized centroids, cluster of each row)"""
+        rng = np.random.default_rng(seed)
+        centroids = np.array(matrix[rng.choice(len(matrix), clusters, replace=False)])
+        for _ in range(iterations):
+            assignments = np.argmax(matrix @ centroids.T, axis=1)
+            for c in range(clusters):
+                members = matrix[assignments == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1)
+        return centroids.astype(np.float32), assignments.astype(np.int32)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, vector, k):
+        """Return [(chunk, score)] for the k most similar chunks by cosine similarity"""
+        if not len(self.chunks):
+            return []
+        query = np.array(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+
+        if self.centroids is not None:
+            probes = np.argsort(self.centroids @ query)[-self.nprobe:]
+            rows = np.flatnonzero(np.isin(self.assignments, probes))
+            scores = self.matrix[rows] @ query
+        else:
+            rows = None
+            scores = self.matrix @ query
+        if not len(scores):
+            return []
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunks[rows[i] if rows is not None else i], float(scores[i])) for i in top]
+
+
+class NumpyRetriever:
+    """Drop-in replacement for the Chroma retriever: invoke(question) -> documents"""
+
+    def __init__(self, index, embeddings, k=2):
+        self.index = index
+        self.embeddings = embeddings
+        self.k = k
+
+    def invoke(self, question):
+        return self.search(question, self.k)
+
+    def search(self, question, k):
+        vector = self.embeddings.embed_query(question)
+        return [
+            Document(page_content=chunk["text"], metadata=dict(chunk["metadata"], score=score))
+            for chunk, score in self.index.search(vector, k)
+        ]
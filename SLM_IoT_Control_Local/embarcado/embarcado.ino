@@ -11,6 +11,14 @@
 #include <HTTPClient.h>  // Include HTTPClient library to make HTTP requests
 #include <ArduinoJson.h> // Include ArduinoJson library for JSON manipulation
 
+// Uncomment to talk to the backend over one persistent MQTT connection
+// (needs MQTT_HOST in credentials.h and the PubSubClient library)
+// #define USE_MQTT
+
+#ifdef USE_MQTT
+#include "mqtt.h" // Include MQTT channel
+#endif
+
 // ============================================================================
 // DATA STRUCTURES
 // ============================================================================
@@ -38,6 +46,19 @@ struct PomodoroStatus
   int minutes;
 };
 
+// Last state sent to the backend, requests only carry the fields that changed
+struct DeviceSnapshot
+{
+  float temperature;
+  float humidity;
+  bool buttonPressed;
+  bool ledRed;
+  bool ledBlue;
+  bool ledGreen;
+  int ldrValue;
+  int servoAngle;
+};
+
 struct responseLLM
 {
   String message;
@@ -55,6 +76,12 @@ String serverPath = API_URL;
 String model = "gemma3"; // LLM model to be used
 int servoAngle = 0;
 
+String deviceId;                                  // Board MAC address, key of the backend state store
+struct DeviceSnapshot lastSent;                   // State the backend already knows
+bool hasLastSent = false;                         // false -> next request sends the full snapshot
+const unsigned long TELEMETRY_INTERVAL = 30000;   // Telemetry push interval (ms), feeds the trends
+unsigned long lastTelemetry = 0;
+
 // ============================================================================
 // FUNÇÕES DE LEITURA DE SENSORES
 // ============================================================================
@@ -95,41 +122,122 @@ struct LedStatus readLedStatus()
 // HTTP COMMUNICATION FUNCTIONS
 // ============================================================================
 
-struct responseLLM sendToLlm(float temp, float hum, bool button_state, bool ledRed, bool ledBlue, bool ledGreen, int ldrValue, int servoAngle, String input)
+// Add the fields that changed since the last request (all of them when the backend has no state)
+void addStateDelta(DynamicJsonDocument &doc, struct DeviceSnapshot current)
 {
-  struct responseLLM response;
+  doc["device_id"] = deviceId;
+  if (!hasLastSent || fabs(current.temperature - lastSent.temperature) >= 0.1)
+    doc["temperature"] = current.temperature;
+  if (!hasLastSent || fabs(current.humidity - lastSent.humidity) >= 0.1)
+    doc["humidity"] = current.humidity;
+  if (!hasLastSent || current.buttonPressed != lastSent.buttonPressed)
+    doc["btn_pressed"] = current.buttonPressed;
+  if (!hasLastSent || current.ledRed != lastSent.ledRed)
+    doc["led_red"] = current.ledRed;
+  if (!hasLastSent || current.ledBlue != lastSent.ledBlue)
+    doc["led_blue"] = current.ledBlue;
+  if (!hasLastSent || current.ledGreen != lastSent.ledGreen)
+    doc["led_green"] = current.ledGreen;
+  if (!hasLastSent || abs(current.ldrValue - lastSent.ldrValue) >= 16)
+    doc["ldr_value"] = current.ldrValue;
+  if (!hasLastSent || current.servoAngle != lastSent.servoAngle)
+    doc["servo_angle"] = current.servoAngle;
+}
+
+// Remember what the backend received, so only later changes are sent
+void markSent(DynamicJsonDocument &doc)
+{
+  if (doc.containsKey("temperature")) lastSent.temperature = doc["temperature"];
+  if (doc.containsKey("humidity")) lastSent.humidity = doc["humidity"];
+  if (doc.containsKey("btn_pressed")) lastSent.buttonPressed = doc["btn_pressed"];
+  if (doc.containsKey("led_red")) lastSent.ledRed = doc["led_red"];
+  if (doc.containsKey("led_blue")) lastSent.ledBlue = doc["led_blue"];
+  if (doc.containsKey("led_green")) lastSent.ledGreen = doc["led_green"];
+  if (doc.containsKey("ldr_value")) lastSent.ldrValue = doc["ldr_value"];
+  if (doc.containsKey("servo_angle")) lastSent.servoAngle = doc["servo_angle"];
+  hasLastSent = true;
+}
 
-  String classification = sendClassificationToLlm(input);
-  if (classification == "Error")
+// Apply the actions of backend automation rules, only the actuators the rules set
+void applyRuleActions(JsonObject actions, String message)
+{
+  struct LedStatus leds = readLedStatus();
+  setLeds(actions["red_led"] | leds.red, actions["blue_led"] | leds.blue, actions["green_led"] | leds.green);
+  servoAngle = actions["servo_angle"] | servoAngle;
+  Serial.println("Automation: " + message);
+  showMessage("Automation: " + message);
+}
+
+// Periodic sensor push, lets the backend report trends without bigger requests.
+// The response carries the actions of automation rules that fired since the last push.
+void pushTelemetry(struct DeviceSnapshot current)
+{
+  DynamicJsonDocument doc(512);
+  addStateDelta(doc, current);
+  String jsonRequest;
+  serializeJson(doc, jsonRequest);
+#ifdef USE_MQTT
+  // Fired automation actions arrive on the command topic instead of the response
+  if (publishMqtt("telemetry", jsonRequest))
+    markSent(doc);
+  else
+    hasLastSent = false;
+#else
+  HTTPClient http;
+  http.setTimeout(5000);
+  http.begin((serverPath + "/devices/" + deviceId + "/telemetry").c_str());
+  http.addHeader("Content-Type", "application/json");
+  int httpCode = http.POST(jsonRequest);
+  if (httpCode != HTTP_CODE_OK)
   {
-    response.message = "Error: Invalid classification";
-    response.success = false;
-    return response;
+    http.end();
+    hasLastSent = false;
+    return;
   }
+  markSent(doc);
+  String jsonResponse = http.getString();
+  http.end();
+
+  DynamicJsonDocument responseDoc(512);
+  if (!deserializeJson(responseDoc, jsonResponse) && responseDoc.containsKey("actions"))
+  {
+    applyRuleActions(responseDoc["actions"], responseDoc["message"] | "");
+  }
+#endif
+}
+
+struct responseLLM sendToLlm(float temp, float hum, bool button_state, bool ledRed, bool ledBlue, bool ledGreen, int ldrValue, int servoAngle, String input)
+{
+  struct responseLLM response;
+  struct DeviceSnapshot current = {temp, hum, button_state, ledRed, ledBlue, ledGreen, ldrValue, servoAngle};
 
   HTTPClient http;                                    // Create an HTTP client instance
   http.setTimeout(120000);                            // Set read timeout to 120 seconds
-  http.begin((serverPath + "/ollama").c_str());       // Start the connection to the server on the route
+  http.begin((serverPath + "/query").c_str());        // Classification and answer in a single request
   http.addHeader("Content-Type", "application/json"); // Add the Content-Type header
   http.addHeader("Connection", "keep-alive");
   http.addHeader("keep-alive", "timeout=120");
 
-  // Create request JSON
+  // Create request JSON: device id, changed fields and the user input
   DynamicJsonDocument doc(1024);
-  doc["temperature"] = temp;
-  doc["humidity"] = hum;
-  doc["btn_pressed"] = button_state;
-  doc["led_red"] = ledRed;
-  doc["led_blue"] = ledBlue;
-  doc["led_green"] = ledGreen;
-  doc["ldr_value"] = ldrValue;
-  doc["servo_angle"] = servoAngle;
+  addStateDelta(doc, current);
   doc["user_input"] = input;
-  doc["classification"] = classification;
   String jsonRequest;
   serializeJson(doc, jsonRequest);
   // Send request
   int httpCode = http.POST(jsonRequest);
+  if (httpCode == HTTP_CODE_CONFLICT)
+  {
+    // Backend lost our state (e.g. restart): send the full snapshot again
+    Serial.println(F("[HTTP] Backend has no state for this board, resending full snapshot"));
+    hasLastSent = false;
+    doc.clear();
+    addStateDelta(doc, current);
+    doc["user_input"] = input;
+    jsonRequest = "";
+    serializeJson(doc, jsonRequest);
+    httpCode = http.POST(jsonRequest);
+  }
   if (httpCode != HTTP_CODE_OK)
   {
     Serial.printf("[HTTP] ERROR: Code %d - %s\n",
@@ -137,8 +245,10 @@ struct responseLLM sendToLlm(float temp, float hum, bool button_state, bool ledR
     http.end();
     response.message = "Error: Invalid server response";
     response.success = false;
+    hasLastSent = false;
     return response;
   }
+  markSent(doc);
   // Process response
   String jsonResponse = http.getString();
   http.end();
@@ -155,9 +265,13 @@ struct responseLLM sendToLlm(float temp, float hum, bool button_state, bool ledR
     return response;
   }
 
-  // Extrair dados da resposta
-  // Serial.println(String(responseDoc["response"]));
+  return parseResponse(responseDoc);
+}
 
+// Extract the answer fields, shared by the HTTP response and the final MQTT event
+struct responseLLM parseResponse(DynamicJsonDocument &responseDoc)
+{
+  struct responseLLM response;
   response.message = responseDoc["message"] | "Sem resposta";
   response.leds.red = responseDoc["red_led"] | false;
   response.leds.blue = responseDoc["blue_led"] | false;
@@ -171,43 +285,154 @@ struct responseLLM sendToLlm(float temp, float hum, bool button_state, bool ledR
   return response;
 }
 
-String sendClassificationToLlm(String input)
+// Show the answer and drive the actuators
+void applyResponse(struct responseLLM response)
+{
+  // Display assistant's message
+  Serial.println("Assistant: " + response.message);
+
+  // Mostra no display (resposta IA)
+  showMessage("Assistant: " + response.message);
+
+  if (!response.success)
+  {
+    return;
+  }
+
+  // Control LEDs based on response
+  setLeds(response.leds.red, response.leds.blue, response.leds.green);
+
+  // Ajusta servo
+  servoAngle = response.servoAngle;
+  // myServo.write(servoAngle);
+
+  // Configura o pomodoro
+  if (response.pomodoro.start)
+  {
+    int minutes = response.pomodoro.minutes;
+    startPomodoro(minutes);
+  }
+  else if (response.pomodoro.stop)
+  {
+    stopPomodoro();
+  }
+  printMenu();
+}
+
+#ifdef USE_MQTT
+String pendingInput; // Question waiting for its final MQTT event
+bool fieldsApplied;  // Actuators already driven by the field events of the pending answer
+
+// Publish the question with the changed fields, the answer arrives in onMqttMessage()
+void sendQueryMqtt(struct DeviceSnapshot current, String input)
 {
-  HTTPClient http;                                      // Create an HTTP client instance
-  http.setTimeout(60000);                               // Set read timeout to 60 seconds
-  http.begin((serverPath + "/classification").c_str()); // Start the connection to the server on the route
-  http.addHeader("Content-Type", "application/json");
-  http.addHeader("Connection", "keep-alive");
-  // Create request JSON
   DynamicJsonDocument doc(1024);
+  addStateDelta(doc, current);
   doc["user_input"] = input;
-  String jsonRequest;
-  serializeJson(doc, jsonRequest);
-  // Send request
-  int httpCode = http.POST(jsonRequest);
-  if (httpCode != HTTP_CODE_OK)
+  String payload;
+  serializeJson(doc, payload);
+  if (!publishMqtt("query", payload))
   {
-    Serial.printf("[HTTP_1] ERROR: Code %d - %s\n", httpCode, http.errorToString(httpCode).c_str());
-    http.end();
-    return "Error";
+    Serial.println(F("[MQTT] ERROR: Broker not connected"));
+    hasLastSent = false;
+    return;
   }
-  // Process response
-  String jsonResponse = http.getString();
-  http.end();
+  markSent(doc);
+  pendingInput = input;
+  fieldsApplied = false;
+}
 
-  DynamicJsonDocument responseDoc(1024);
-  DeserializationError error = deserializeJson(responseDoc, jsonResponse);
+// Drive an actuator as soon as its field is complete, before the message is generated
+void applyFieldEvent(String field, JsonVariant value)
+{
+  if (field == "leds")
+  {
+    struct LedStatus leds = readLedStatus();
+    setLeds(value["red_led"] | leds.red, value["blue_led"] | leds.blue, value["green_led"] | leds.green);
+  }
+  else if (field == "servo_angle")
+  {
+    servoAngle = value | servoAngle;
+  }
+  else if (field == "pomodoro")
+  {
+    if (value["start"] | false)
+    {
+      startPomodoro(value["minutes"] | 0);
+    }
+    else if (value["stop"] | false)
+    {
+      stopPomodoro();
+    }
+  }
+  else
+  {
+    return;
+  }
+  fieldsApplied = true;
+}
 
-  if (error)
+// Answer events (".../response") and automation actions (".../command")
+void onMqttMessage(char *topic, uint8_t *payload, unsigned int length)
+{
+  DynamicJsonDocument doc(4096);
+  if (deserializeJson(doc, payload, length))
   {
-    Serial.print(F("[HTTP_2] ERROR: Failed to parse JSON: "));
-    Serial.println(error.c_str());
-    return "Error";
+    Serial.println(F("[MQTT] ERROR: Failed to parse JSON"));
+    return;
   }
-  // Extrair dados da resposta
-  String classification = responseDoc["classification"];
-  return classification;
+  if (String(topic).endsWith("/command"))
+  {
+    applyRuleActions(doc["actions"], doc["message"] | "");
+    return;
+  }
+  if (doc.containsKey("token"))
+  {
+    Serial.print(doc["token"].as<const char *>()); // Streamed answer text
+    return;
+  }
+  if (doc.containsKey("field"))
+  {
+    applyFieldEvent(doc["field"].as<String>(), doc["value"]);
+    return;
+  }
+  if (!doc["done"])
+  {
+    return;
+  }
+  if (doc.containsKey("missing") && pendingInput.length() > 0)
+  {
+    // Backend lost our state (e.g. restart): send the full snapshot again
+    Serial.println(F("[MQTT] Backend has no state for this board, resending full snapshot"));
+    hasLastSent = false;
+    struct SensorData data = readSensors();
+    struct LedStatus leds = readLedStatus();
+    sendQueryMqtt({data.temperature, data.humidity, data.buttonPressed, leds.red, leds.blue, leds.green, data.ldrValue, servoAngle}, pendingInput);
+    return;
+  }
+  pendingInput = "";
+  Serial.println();
+  if (doc.containsKey("error"))
+  {
+    struct responseLLM response;
+    response.message = "Error: " + String(doc["error"] | "");
+    response.success = false;
+    applyResponse(response);
+    return;
+  }
+  struct responseLLM response = parseResponse(doc);
+  if (fieldsApplied)
+  {
+    // LEDs, servo and pomodoro were set by the field events, only show the message
+    fieldsApplied = false;
+    Serial.println("Assistant: " + response.message);
+    showMessage("Assistant: " + response.message);
+    printMenu();
+    return;
+  }
+  applyResponse(response);
 }
+#endif
 
 // ============================================================================
 // INTERFACE FUNCTIONS
@@ -256,6 +481,11 @@ void printMenu()
 void setup()
 {
   initFranzininho();
+  deviceId = WiFi.macAddress();
+  deviceId.replace(":", "");
+#ifdef USE_MQTT
+  initMqtt(deviceId, onMqttMessage);
+#endif
   printMenu();
 }
 
@@ -263,6 +493,21 @@ void loop()
 {
   btn.update();
   updatePomodoro();
+#ifdef USE_MQTT
+  mqttLoop();
+#endif
+
+  // Periodic telemetry, only the readings that changed
+  if (millis() - lastTelemetry >= TELEMETRY_INTERVAL)
+  {
+    lastTelemetry = millis();
+    struct SensorData sample = readSensors();
+    if (sample.success)
+    {
+      struct LedStatus leds = readLedStatus();
+      pushTelemetry({sample.temperature, sample.humidity, sample.buttonPressed, leds.red, leds.blue, leds.green, sample.ldrValue, servoAngle});
+    }
+  }
   if (Serial.available())
   {
 
@@ -289,40 +534,18 @@ void loop()
       return;
     }
 
+#ifdef USE_MQTT
+    // The answer is streamed back on the response topic, the loop keeps running meanwhile
+    Serial.println("\nAssistant: [Thinking...]");
+    sendQueryMqtt({data.temperature, data.humidity, data.buttonPressed, ledSts.red, ledSts.blue, ledSts.green, data.ldrValue, servoAngle}, input);
+#else
     // Send data to the LLM and get the response
     struct responseLLM response = sendToLlm(data.temperature, data.humidity, data.buttonPressed, ledSts.red, ledSts.blue, ledSts.green, data.ldrValue, servoAngle, input);
 
     // Get SLM response
     Serial.println("\nAssistant: [Thinking...]");
 
-    // Display assistant's message
-    Serial.println("Assistant: " + response.message);
-
-    // Mostra no display (resposta IA)
-    showMessage("Assistant: " + response.message);
-
-    if (!response.success)
-    {
-      return;
-    }
-
-    // Control LEDs based on response
-    setLeds(response.leds.red, response.leds.blue, response.leds.green);
-
-    // Ajusta servo
-    servoAngle = response.servoAngle;
-    // myServo.write(servoAngle);
-
-    // Configura o pomodoro
-    if (response.pomodoro.start)
-    {
-      int minutes = response.pomodoro.minutes;
-      startPomodoro(minutes);
-    }
-    else if (response.pomodoro.stop)
-    {
-      stopPomodoro();
-    }
-    printMenu();
+    applyResponse(response);
+#endif
   }
 }
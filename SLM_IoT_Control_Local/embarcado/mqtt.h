@@ -0,0 +1,63 @@
+#ifndef MQTT_H
+#define MQTT_H
+
+#include <WiFi.h>
+#include <PubSubClient.h> // Include MQTT client library
+#include "credentials.h"  // Include MQTT_HOST, MQTT_USERNAME and MQTT_PASSWORD
+
+// ============================================================================
+// CONFIGURATION DEFINITIONS
+// ============================================================================
+
+const uint16_t MQTT_PORT = 1883;
+const unsigned long MQTT_RETRY_INTERVAL = 5000; // Reconnect attempt interval (ms)
+
+// ============================================================================
+// GLOBAL VARIABLES
+// ============================================================================
+
+WiFiClient mqttWifi;
+PubSubClient mqtt(mqttWifi);
+String mqttPrefix; // "slm/<device_id>/"
+unsigned long lastMqttAttempt = 0;
+
+// ============================================================================
+// MQTT FUNCTIONS
+// ============================================================================
+
+// Broker address, topic prefix and the handler of ".../response" and ".../command"
+void initMqtt(String deviceId, void (*callback)(char *, uint8_t *, unsigned int))
+{
+    mqttPrefix = "slm/" + deviceId + "/";
+    mqtt.setServer(MQTT_HOST, MQTT_PORT);
+    mqtt.setCallback(callback);
+    mqtt.setBufferSize(4096); // Final answer events carry the whole message
+}
+
+// Keep the connection alive, reconnecting every MQTT_RETRY_INTERVAL while the broker is away
+void mqttLoop()
+{
+    if (!mqtt.connected() && millis() - lastMqttAttempt >= MQTT_RETRY_INTERVAL)
+    {
+        lastMqttAttempt = millis();
+        String clientId = "franzininho-" + mqttPrefix.substring(4, mqttPrefix.length() - 1);
+        if (mqtt.connect(clientId.c_str(), MQTT_USERNAME, MQTT_PASSWORD))
+        {
+            Serial.println(F("[MQTT] Connected to broker"));
+            mqtt.subscribe((mqttPrefix + "response").c_str());
+            mqtt.subscribe((mqttPrefix + "command").c_str());
+        }
+        else
+        {
+            Serial.printf("[MQTT] ERROR: Connection failed, state %d\n", mqtt.state());
+        }
+    }
+    mqtt.loop();
+}
+
+bool publishMqtt(String subtopic, String payload)
+{
+    return mqtt.connected() && mqtt.publish((mqttPrefix + subtopic).c_str(), payload.c_str());
+}
+
+#endif